@@ -1,4 +1,5 @@
 import streamlit as st
+from utils.gpt_helpers import usage_summary
 
 # --- Configuration (Sidebar starts expanded) ---
 st.set_page_config(
@@ -131,6 +132,12 @@ with st.sidebar:
     analysis_mode = st.radio("Analysis Mode", ["Basic EDA", "Advanced Insights", "Predictive Modeling"], key="analysis_mode_radio")
     with st.expander("Advanced options"):
          st.write("Advanced settings here...")
+    with st.expander("📈 LLM usage (this server process)"):
+         usage = usage_summary()
+         if usage:
+              st.dataframe(usage, use_container_width=True)
+         else:
+              st.caption("No LLM calls yet.")
 
 
 # --- Main Area Logic ---
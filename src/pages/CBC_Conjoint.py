@@ -3,7 +3,8 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import statsmodels.api as sm
-from openai import OpenAI
+from utils.gpt_helpers import chat_completion
+from utils.loader import load_table, memory_caption
 import os
 from fpdf import FPDF
 from io import BytesIO
@@ -13,13 +14,12 @@ st.set_page_config(page_title="CBC Conjoint Analysis", layout="wide")
 st.title("📦 CBC Conjoint Module")
 st.caption("Estimate part-worth utilities and simulate preferences from CBC choice task data.")
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 uploaded_file = st.file_uploader("Upload CBC Choice Task Data (Excel or CSV)", type=["xlsx", "csv"])
 
 if uploaded_file:
-    df = pd.read_excel(uploaded_file) if uploaded_file.name.endswith(".xlsx") else pd.read_csv(uploaded_file)
+    df, load_report = load_table(uploaded_file)
     st.success(f"Loaded {df.shape[0]} rows and {df.shape[1]} columns.")
+    st.caption(memory_caption(load_report))
     st.dataframe(df.head())
 
     id_col = st.selectbox("Respondent ID column", df.columns)
@@ -54,14 +54,14 @@ if uploaded_file:
 Summarize the key takeaways, attribute importance, and strategic recommendations."""
         try:
             with st.spinner("GPT analyzing..."):
-                response = client.chat.completions.create(
+                insight = chat_completion(
                     model="gpt-3.5-turbo",
                     messages=[
                         {"role": "system", "content": prompt},
                         {"role": "user", "content": "Please summarize key findings."}
-                    ]
+                    ],
+                    module="CBC"
                 )
-                insight = response.choices[0].message.content
                 st.subheader("💬 GPT Insight")
                 st.markdown(insight)
 
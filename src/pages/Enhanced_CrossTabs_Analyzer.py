@@ -1,10 +1,11 @@
 import streamlit as st
-import pandas as pd
-from io import BytesIO
 import tempfile
 from docx import Document
-from openai import OpenAI
 import os
+from utils.parsers import excel_sheet_names, load_banner_tables, format_banner_table, PARSER_VERSION
+from utils.cache import content_key
+from utils.exports import write_tables_xlsx, write_table_xlsx, XLSX_MIME
+from utils.gpt_helpers import chat_batch, chat_completion
 
 # ============================== CONFIG ==============================
 st.set_page_config(page_title="📊 CrossTabs Analyzer", layout="wide")
@@ -19,69 +20,46 @@ uploaded_file = st.file_uploader("Upload Excel File", type=["xlsx"])
 
 if uploaded_file:
     sheet_name = "Banner"
-    xls = pd.ExcelFile(uploaded_file)
-    if sheet_name not in xls.sheet_names:
+    file_bytes = uploaded_file.getvalue()
+    if sheet_name not in excel_sheet_names(file_bytes):
         st.error("❌ 'Banner' sheet not found in file")
     else:
-        df = pd.read_excel(xls, sheet_name=sheet_name, header=None)
         st.success("✅ File loaded successfully")
 
         # ============================== PARSER ==============================
-        def parse_tables(df):
-            segment_names = ["Group A", "Group B", "Group C", "Group D"]
-            tables = []
-            row = 1
-            while row < len(df):
-                if "Table Title" in str(df.iloc[row, 1]):
-                    table_title = str(df.iloc[row + 1, 1])
-                    base_counts = df.iloc[row + 6, 3:7].tolist()
-                    segment_labels = [
-                        f"{name} (n={int(count)})" if pd.notnull(count) else f"{name} (n=NA)"
-                        for name, count in zip(segment_names, base_counts)
-                    ]
-                    table_rows = []
-                    sub_row = row + 8
-                    while sub_row + 2 < len(df) and isinstance(df.iloc[sub_row, 2], str):
-                        metric_label = df.iloc[sub_row, 2]
-                        try:
-                            freqs = [df.iloc[sub_row, col] for col in range(3, 7)]
-                            percs = [df.iloc[sub_row + 1, col] for col in range(3, 7)]
-                            sigs_raw = df.iloc[sub_row + 2, 3:7].tolist()
-                            values = [
-                                f"{float(p)*100:.1f}% ({int(f)})"
-                                if pd.notna(p) and pd.notna(f) and p != '-' and f != '-'
-                                else ""
-                                for p, f in zip(percs, freqs)
-                            ]
-                            sig_combined = ', '.join([
-                                str(sig) for sig in sigs_raw if pd.notna(sig) and isinstance(sig, str)
-                            ])
-                            table_rows.append([metric_label] + values + [sig_combined])
-                        except:
-                            break
-                        sub_row += 3
-                    table_df = pd.DataFrame(table_rows, columns=["Metric"] + segment_labels + ["Sig"])
-                    tables.append((table_title, table_df))
-                    row = sub_row
-                else:
-                    row += 1
-            return tables
-
-        tables = parse_tables(df)
+        tables = [(t["title"], format_banner_table(t)) for t in load_banner_tables(file_bytes, sheet_name)]
         st.success(f"📈 Parsed {len(tables)} tables successfully")
 
-        # ============================== ANALYSIS ==============================
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # ============================== EXPORT ==============================
+        file_key = content_key(file_bytes, sheet_name, PARSER_VERSION)
 
-        for i, (title, table_df) in enumerate(tables):
-            st.subheader(f"📘 Table {i+1}: {title}")
-            st.dataframe(table_df, use_container_width=True)
+        @st.cache_data(show_spinner=False, max_entries=8)
+        def export_all(file_key, layout, _tables):
+            return write_tables_xlsx(_tables, layout=layout)
 
-            if st.button(f"🧠 Generate Insight for Table {i+1}"):
-                with st.spinner("Sending to GPT for strategic summary..."):
-                    try:
-                        content_text = table_df.to_markdown(index=False)
-                        prompt = f"""
+        @st.cache_data(show_spinner=False, max_entries=256)
+        def export_table(file_key, index, _table_df):
+            return write_table_xlsx(_table_df)
+
+        with st.expander("📦 Export all tables", expanded=False):
+            layout = st.radio("Layout", ["One sheet per table", "All tables on one sheet"], horizontal=True)
+            layout_key = "stacked" if layout.startswith("All") else "sheets"
+            if st.button("Prepare Excel export"):
+                st.session_state["export_ready"] = (file_key, layout_key)
+            if st.session_state.get("export_ready") == (file_key, layout_key):
+                with st.spinner("Writing workbook..."):
+                    export_bytes = export_all(file_key, layout_key, tables)
+                st.download_button(
+                    label="⬇️ Download All Tables (Excel)",
+                    data=export_bytes,
+                    file_name="CrossTabs_All_Tables.xlsx",
+                    mime=XLSX_MIME
+                )
+
+        # ============================== ANALYSIS ==============================
+        def insight_messages(title, table_df):
+            content_text = table_df.to_markdown(index=False)
+            prompt = f"""
 You are a senior market research strategist. Analyze the following cross-tab table and provide a strategic executive summary.
 
 Include:
@@ -93,27 +71,67 @@ Table Title: {title}
 
 {content_text}
 """
-                        response = client.chat.completions.create(
+            return [
+                {"role": "system", "content": "You are a market insights strategist."},
+                {"role": "user", "content": prompt}
+            ]
+
+        insights = st.session_state.setdefault("insights", {}).setdefault(file_key, {})
+
+        with st.expander("🧠 Generate insights for all tables", expanded=False):
+            c1, c2, c3 = st.columns(3)
+            rpm = c1.number_input("Requests per minute", 1, 10000, 500)
+            tpm = c2.number_input("Tokens per minute", 1000, 10_000_000, 150_000, step=1000)
+            concurrency = c3.number_input("Concurrent requests", 1, 64, 8)
+            pending = [i for i in range(len(tables)) if i not in insights]
+            if st.button(f"🚀 Generate {len(pending)} missing insights", disabled=not pending):
+                progress = st.progress(0.0, text="Sending tables to GPT...")
+                failures = []
+
+                def on_result(k, result):
+                    index = pending[k]
+                    if isinstance(result, Exception):
+                        failures.append((index, result))
+                    else:
+                        insights[index] = result
+                    done = len(insights) - (len(tables) - len(pending)) + len(failures)
+                    progress.progress(done / len(pending), text=f"{done}/{len(pending)} tables done")
+
+                chat_batch(
+                    [insight_messages(*tables[i]) for i in pending],
+                    model="gpt-4", rpm=int(rpm), tpm=int(tpm), concurrency=int(concurrency),
+                    on_result=on_result, module="CrossTabs"
+                )
+                for index, e in failures:
+                    st.error(f"GPT error on Table {index+1}: {e}")
+
+        for i, (title, table_df) in enumerate(tables):
+            st.subheader(f"📘 Table {i+1}: {title}")
+            st.dataframe(table_df, use_container_width=True)
+
+            if i not in insights and st.button(f"🧠 Generate Insight for Table {i+1}"):
+                with st.spinner("Sending to GPT for strategic summary..."):
+                    try:
+                        insights[i] = chat_completion(
                             model="gpt-4",
-                            messages=[
-                                {"role": "system", "content": "You are a market insights strategist."},
-                                {"role": "user", "content": prompt}
-                            ]
+                            messages=insight_messages(title, table_df),
+                            module="CrossTabs"
                         )
-                        insight = response.choices[0].message.content
-                        st.markdown("### 💡 GPT Insight")
-                        st.markdown(insight)
                     except Exception as e:
                         st.error(f"GPT error: {e}")
+            if i in insights:
+                st.markdown("### 💡 GPT Insight")
+                st.markdown(insights[i])
 
-            # Export button
-            excel_buffer = BytesIO()
-            with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-                table_df.to_excel(writer, index=False, sheet_name="Formatted Table")
-            excel_buffer.seek(0)
-            st.download_button(
-                label=f"⬇️ Download Table {i+1} (Excel)",
-                data=excel_buffer,
-                file_name=f"Table_{i+1}_{title[:20].replace(' ', '_')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            # Export button: the workbook is only built once the user asks for it
+            requested = st.session_state.setdefault("export_requested", set())
+            if (file_key, i) not in requested:
+                if st.button(f"📦 Prepare Table {i+1} (Excel)"):
+                    requested.add((file_key, i))
+            if (file_key, i) in requested:
+                st.download_button(
+                    label=f"⬇️ Download Table {i+1} (Excel)",
+                    data=export_table(file_key, i, table_df),
+                    file_name=f"Table_{i+1}_{title[:20].replace(' ', '_')}.xlsx",
+                    mime=XLSX_MIME
+                )
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 from io import BytesIO
 from docx import Document
@@ -7,6 +8,7 @@ from docx.shared import Inches
 from fpdf import FPDF
 import base64
 import tempfile
+from utils.parsers import excel_sheet_names, load_banner_tables, format_banner_table
 
 st.set_page_config(page_title="Executive Insight Generator", layout="wide")
 st.title("📊 Executive Insight Generator")
@@ -15,9 +17,9 @@ st.sidebar.header("Upload Crosstab File")
 uploaded_file = st.sidebar.file_uploader("Upload a WinCross-style Excel file (.xlsx)", type="xlsx")
 
 if uploaded_file:
-    sheet_names = pd.ExcelFile(uploaded_file).sheet_names
+    file_bytes = uploaded_file.getvalue()
+    sheet_names = excel_sheet_names(file_bytes)
     selected_sheet = st.sidebar.selectbox("Select Sheet", sheet_names)
-    df = pd.read_excel(uploaded_file, sheet_name=selected_sheet, header=None)
     st.success(f"Loaded sheet: {selected_sheet}")
 
     banner_options = [
@@ -28,68 +30,25 @@ if uploaded_file:
     ]
     selected_banner = st.sidebar.selectbox("Select Banner Breakout", banner_options)
 
-    def parse_tables(df):
-        segment_names = ["Frugal Basics", "Resourceful Savers", "Performance Enthusiasts", "Urban Techies"]
-        tables = []
-        row = 1
-        while row < len(df):
-            if "Table Title" in str(df.iloc[row, 1]):
-                table_title = str(df.iloc[row + 1, 1])
-                base_counts = df.iloc[row + 6, 3:7].tolist()
-                segment_labels = [
-                    f"{name} (n={int(count)})" if pd.notnull(count) else f"{name} (n=NA)"
-                    for name, count in zip(segment_names, base_counts)
-                ]
-                table_rows = []
-                sub_row = row + 8
-                while sub_row + 2 < len(df) and isinstance(df.iloc[sub_row, 2], str):
-                    metric_label = df.iloc[sub_row, 2]
-                    try:
-                        freqs = [df.iloc[sub_row, col] for col in range(3, 7)]
-                        percs = [df.iloc[sub_row + 1, col] for col in range(3, 7)]
-                        sigs_raw = df.iloc[sub_row + 2, 3:7].tolist()
-                        values = [
-                            f"{float(p)*100:.1f}% ({int(f)})"
-                            if pd.notna(p) and pd.notna(f) and p != '-' and f != '-'
-                            else ""
-                            for p, f in zip(percs, freqs)
-                        ]
-                        sig_combined = ', '.join([str(sig) for sig in sigs_raw if pd.notna(sig) and isinstance(sig, str)])
-                        table_rows.append([metric_label] + values + [sig_combined])
-                    except:
-                        break
-                    sub_row += 3
-                table_df = pd.DataFrame(table_rows, columns=["Metric"] + segment_labels + ["Sig"])
-                tables.append((table_title, table_df))
-                row = sub_row
-            else:
-                row += 1
-        return tables
-
-    def generate_insights(df_table):
+    def generate_insights(table):
         summary_lines = []
-        rows = df_table.head(4)
-        for _, row in rows.iterrows():
-            try:
-                values = row[1:-1].tolist()
-                metric = row["Metric"]
-                high_idx = max(range(len(values)), key=lambda i: float(values[i].split('%')[0]) if '%' in values[i] else -1)
-                low_idx = min(range(len(values)), key=lambda i: float(values[i].split('%')[0]) if '%' in values[i] else float('inf'))
-                segments = df_table.columns[1:-1].tolist()
-                high_val = values[high_idx]
-                low_val = values[low_idx]
-                summary_lines.append(f"{segments[high_idx]} leads in {metric.lower()} at {high_val}, while {segments[low_idx]} trails at {low_val}.")
-            except:
+        segments = table["segments"]
+        cells = format_banner_table(table).iloc[:, 1:-1].to_numpy()
+        for i, (metric, pct) in enumerate(zip(table["metrics"][:4], table["pct"][:4])):
+            if np.isnan(pct).all():
                 continue
+            high_idx = int(np.nanargmax(pct))
+            low_idx = int(np.nanargmin(pct))
+            high_val = cells[i, high_idx]
+            low_val = cells[i, low_idx]
+            summary_lines.append(f"{segments[high_idx]} leads in {metric.lower()} at {high_val}, while {segments[low_idx]} trails at {low_val}.")
         return summary_lines
 
-    def generate_chart(df_table, title):
-        chart_df = df_table.head(4).copy()
-        for col in chart_df.columns[1:-1]:
-            chart_df[col] = chart_df[col].str.extract(r"([\d\.]+)%").astype(float)
+    def generate_chart(table, title):
         fig, ax = plt.subplots(figsize=(8, 4))
-        for col in chart_df.columns[1:-1]:
-            ax.plot(chart_df["Metric"], chart_df[col], marker='o', label=col)
+        metrics = table["metrics"][:4]
+        for j, segment in enumerate(table["segments"]):
+            ax.plot(metrics, table["pct"][:4, j] * 100, marker='o', label=segment)
         ax.set_title(title)
         ax.set_ylabel("%")
         ax.legend()
@@ -97,19 +56,20 @@ if uploaded_file:
         plt.tight_layout()
         return fig
 
-    tables = parse_tables(df)
-    table_titles = [f"Table {i+1}: {t[0][:60]}" for i, t in enumerate(tables)]
+    tables = load_banner_tables(file_bytes, selected_sheet)
+    table_titles = [f"Table {i+1}: {t['title'][:60]}" for i, t in enumerate(tables)]
     selected_idx = st.sidebar.selectbox("Select a table to preview", options=range(len(tables)), format_func=lambda x: table_titles[x])
 
-    table_title, table_df = tables[selected_idx]
+    table = tables[selected_idx]
+    table_title, table_df = table["title"], format_banner_table(table)
     st.subheader(f"📘 {table_title}")
     st.dataframe(table_df, use_container_width=True)
 
     st.markdown("**Key Findings:**")
-    insights = generate_insights(table_df)
+    insights = generate_insights(table)
     for line in insights:
         st.markdown(f"- {line}")
 
     st.markdown("**Chart:**")
-    fig = generate_chart(table_df, table_title)
+    fig = generate_chart(table, table_title)
     st.pyplot(fig)
@@ -4,20 +4,20 @@ import numpy as np
 import os
 from sklearn.mixture import GaussianMixture
 import matplotlib.pyplot as plt
-from openai import OpenAI
+from utils.gpt_helpers import chat_completion
+from utils.loader import load_table, memory_caption
 
 st.set_page_config(page_title="Latent Class Analysis", layout="wide")
 st.title("🧬 Latent Class Analysis (LCA) Module")
 
 st.markdown("Upload survey data to segment respondents into latent classes based on behavioral patterns.")
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 uploaded_file = st.file_uploader("Upload CSV or Excel file", type=["csv", "xlsx"])
 
 if uploaded_file:
-    df = pd.read_excel(uploaded_file) if uploaded_file.name.endswith("xlsx") else pd.read_csv(uploaded_file)
+    df, load_report = load_table(uploaded_file)
     st.success(f"Loaded {df.shape[0]} rows and {df.shape[1]} columns.")
+    st.caption(memory_caption(load_report))
     st.dataframe(df.head())
 
     input_cols = st.multiselect("Select numeric columns to use for segmentation", df.select_dtypes(include=np.number).columns)
@@ -47,14 +47,15 @@ if uploaded_file:
         prompt = f"You are an insights analyst. Here are average profiles for each segment:\n{means.to_string()}"
         try:
             with st.spinner("GPT interpreting segment profiles..."):
-                response = client.chat.completions.create(
+                insight = chat_completion(
                     model="gpt-3.5-turbo",
                     messages=[
                         {"role": "system", "content": prompt},
                         {"role": "user", "content": "Please summarize each segment and provide high-level interpretations."}
-                    ]
+                    ],
+                    module="LCA"
                 )
                 st.subheader("💬 GPT Insight")
-                st.markdown(response.choices[0].message.content)
+                st.markdown(insight)
         except Exception as e:
             st.error(f"GPT error: {e}")
\ No newline at end of file
@@ -4,20 +4,20 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import statsmodels.api as sm
 import os
-from openai import OpenAI
+from utils.gpt_helpers import chat_completion
+from utils.loader import load_table, memory_caption
 
 st.set_page_config(page_title="MaxDiff Analysis", layout="wide")
 st.title("📊 MaxDiff Analysis Module")
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 st.markdown("Upload your MaxDiff survey response data to estimate relative preference scores.")
 
 uploaded_file = st.file_uploader("Upload Excel or CSV file", type=["xlsx", "csv"])
 
 if uploaded_file:
-    df = pd.read_excel(uploaded_file) if uploaded_file.name.endswith("xlsx") else pd.read_csv(uploaded_file)
+    df, load_report = load_table(uploaded_file)
     st.success(f"Loaded {df.shape[0]} rows and {df.shape[1]} columns.")
+    st.caption(memory_caption(load_report))
     st.dataframe(df.head())
 
     id_col = st.selectbox("Respondent ID column", df.columns)
@@ -40,14 +40,15 @@ if uploaded_file:
         prompt = f"Here are relative preference scores from a MaxDiff study:\n{scores.to_string()}"
         try:
             with st.spinner("GPT interpreting MaxDiff results..."):
-                response = client.chat.completions.create(
+                insight = chat_completion(
                     model="gpt-3.5-turbo",
                     messages=[
                         {"role": "system", "content": prompt},
                         {"role": "user", "content": "Please summarize key preferences and insights from this MaxDiff data."}
-                    ]
+                    ],
+                    module="MaxDiff"
                 )
                 st.subheader("💬 GPT Insight")
-                st.markdown(response.choices[0].message.content)
+                st.markdown(insight)
         except Exception as e:
             st.error(f"GPT error: {e}")
@@ -1,7 +1,7 @@
 import streamlit as st
 from pptx import Presentation
 import os
-from openai import OpenAI
+from utils.gpt_helpers import chat_completion, generate_image
 import re
 from fpdf import FPDF
 from io import BytesIO
@@ -10,8 +10,6 @@ import requests
 st.set_page_config(page_title="🧠 Persona Generator", layout="wide")
 st.title("🧠 Persona Generator from PowerPoint + DALL·E Avatars")
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 uploaded_file = st.file_uploader("Upload a PowerPoint (.pptx) with segmentation analysis", type=["pptx"])
 
 # Session State Init
@@ -25,25 +23,25 @@ def extract_text_from_pptx(file):
     return "\n".join([shape.text for slide in prs.slides for shape in slide.shapes if hasattr(shape, "text")]).strip()
 
 def generate_gpt_response(prompt):
-    response = client.chat.completions.create(
+    return chat_completion(
         model="gpt-4",
         messages=[
             {"role": "system", "content": "You are a senior market research strategist."},
             {"role": "user", "content": prompt}
-        ]
-    )
-    return response.choices[0].message.content.strip()
+        ],
+        module="PersonaPPTX"
+    ).strip()
 
 def generate_dalle_image(description):
     dalle_prompt = description.strip() if len(description.strip()) > 10 else "realistic portrait of a person based on persona description"
-    response = client.images.generate(
+    return generate_image(
+        dalle_prompt,
         model="dall-e-3",
-        prompt=dalle_prompt,
         size="1024x1024",
         quality="standard",
-        n=1
+        n=1,
+        module="PersonaPPTX"
     )
-    return response.data[0].url
 
 def clean_text(text):
     return text.encode("latin-1", "ignore").decode("latin-1") if isinstance(text, str) else ""
@@ -1,13 +1,14 @@
 import streamlit as st
 import pandas as pd
 import os
-from openai import OpenAI
+from utils.dedup import dedupe_texts
+from utils.gpt_helpers import chat_completion
+from utils.loader import load_table, memory_caption
+from utils.summarize import map_reduce_summarize
 
 st.set_page_config(page_title="👤 AI-Based Persona Generator", layout="wide")
 st.title("👤 AI-Based Persona Generator")
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 # Sidebar UI
 with st.sidebar:
     st.header("📥 Upload Data")
@@ -38,8 +39,9 @@ Customer input:
 if uploaded_file and text_col:
     try:
         # Load data
-        df = pd.read_excel(uploaded_file) if uploaded_file.name.endswith("xlsx") else pd.read_csv(uploaded_file)
+        df, load_report = load_table(uploaded_file)
         st.success(f"✅ Loaded {df.shape[0]} rows, {df.shape[1]} columns")
+        st.caption(memory_caption(load_report))
         st.write("🔍 Data Preview:", df[[text_col]].dropna().head())
 
         if text_col not in df.columns:
@@ -49,18 +51,29 @@ if uploaded_file and text_col:
             if not entries:
                 st.warning("⚠️ No valid responses found in the selected column.")
             else:
-                combined_text = "\n".join(entries[:100])  # Limiting to 100 rows
+                with st.spinner(f"Condensing {len(entries)} responses..."):
+                    # Near-identical answers are sent once, with their count
+                    texts, multiplicity, _ = dedupe_texts(entries)
+                    progress = st.progress(0.0, text="Summarizing response chunks...")
+                    combined_text = map_reduce_summarize(
+                        texts,
+                        "You are a market research analyst. Condense these customer responses into the distinct "
+                        "customer types they reveal: needs, motivations, frustrations, demographics where stated "
+                        "and preferred channels. Quote representative phrases and indicate how common each type is.",
+                        model="gpt-3.5-turbo", module="PersonaGen", weights=multiplicity,
+                        on_progress=lambda stage, done, total: progress.progress(done / total, text=f"{stage}: {done}/{total}")
+                    )
                 final_prompt = persona_prompt_template.format(responses=combined_text)
 
                 with st.spinner("Generating personas..."):
-                    response = client.chat.completions.create(
+                    result = chat_completion(
                         model="gpt-3.5-turbo",
                         messages=[
                             {"role": "system", "content": "You are a helpful market research analyst."},
                             {"role": "user", "content": final_prompt}
-                        ]
+                        ],
+                        module="PersonaGen"
                     )
-                    result = response.choices[0].message.content
                     st.subheader("🎯 Generated Personas")
                     st.markdown(result)
 
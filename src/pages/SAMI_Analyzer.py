@@ -3,16 +3,26 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
-from sklearn.ensemble import RandomForestRegressor
-from scipy import stats
 import os
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from utils.clustering import assign_clusters, cached_matrix, cluster_profiles, select_k, standardize
+from utils.correlation import block_summary, correlation_blocks, correlation_matrix, reduced_matrix, top_pairs
+from utils.drivers import fit_drivers
+from utils.projection import density_grid, fit_pca
+from utils.anomalies import MULTIVARIATE_METHODS, detect_anomalies, reason_labels
+from utils.approximate import (
+    choose_strata, correlation_intervals, numeric_intervals, proportion_interval, required_sample_size,
+    stratified_sample,
+)
+from utils.gpt_helpers import chat_completion, llm_available
+from utils.loader import load_table, memory_caption
+from utils.profiling import dataset_key, profile_dataset, profile_table
 from io import BytesIO
 from datetime import datetime
 from fpdf import FPDF
 import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 
 # === CONFIG ===
 st.set_page_config(page_title="SAMI Analyzer Pro", page_icon="🔍", layout="wide")
@@ -40,11 +50,8 @@ if 'openai_error' not in st.session_state:
     st.session_state.openai_error = None
 
 # === INIT OPENAI ===
-try:
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-except Exception as e:
-    st.session_state.openai_error = f"OpenAI init error: {str(e)}"
-    client = None
+if not llm_available():
+    st.session_state.openai_error = "OpenAI init error: OPENAI_API_KEY is not set"
 
 # === SIDEBAR ===
 with st.sidebar:
@@ -52,7 +59,17 @@ with st.sidebar:
     analysis_mode = st.radio("**Analysis Mode**", ["Basic EDA", "Advanced Insights", "Predictive Modeling"])
     with st.expander("Advanced Options"):
         confidence_level = st.slider("Confidence Level", 0.8, 0.99, 0.95)
+        sample_first = st.checkbox("Sample first on large files", True,
+                                   help="Show results from a stratified sample at once; exact results replace them when ready")
+        sample_rows = st.number_input("Sample size (rows)", 5_000, 1_000_000, 50_000, step=5_000)
+        error_tolerance = st.slider("Error tolerance (± on correlations and proportions)", 0.005, 0.1, 0.02, step=0.005)
         max_categories = st.number_input("Max Categories", 5, 100, 20)
+        anomaly_method = st.selectbox(
+            "Multivariate anomaly detector", list(MULTIVARIATE_METHODS) + ["none"],
+            format_func=lambda m: m.replace("_", " ").title()
+        )
+        cluster_range = st.slider("Cluster counts to try", 2, 15, (2, 8))
+        corr_method = st.radio("Correlation method", ["pearson", "spearman"], horizontal=True)
 
 # === FILE UPLOAD ===
 uploaded_file = st.file_uploader("📁 Upload your dataset", type=["csv", "xlsx"])
@@ -86,89 +103,295 @@ with st.expander("ℹ️ How to use this tool", expanded=False):
 """)
 
 # === HELPERS ===
+# Above this many points, projections are drawn as a server-side density grid
+SCATTER_MAX_POINTS = 50_000
+DIST_PER_PAGE = 6
+# Correlation heatmaps never draw more columns than this; cells are annotated up to CORR_ANNOTATE
+CORR_MAX_COLUMNS = 40
+CORR_ANNOTATE = 20
+
 @st.cache_data
 def load_data(file):
     try:
-        return pd.read_csv(file) if file.name.endswith(".csv") else pd.read_excel(file)
+        return load_table(file)
     except Exception as e:
         st.error(f"❌ File error: {e}")
-        return None
-
-def detect_anomalies(df):
-    numeric_cols = df.select_dtypes(include=np.number).columns
-    outliers = pd.DataFrame()
-    for col in numeric_cols:
-        Q1 = df[col].quantile(0.25)
-        Q3 = df[col].quantile(0.75)
-        IQR = Q3 - Q1
-        mask = (df[col] < Q1 - 1.5 * IQR) | (df[col] > Q3 + 1.5 * IQR)
-        z_scores = np.abs(stats.zscore(df[col].dropna()))
-        z_outliers = df.loc[(z_scores > 3).values]
-        iqr_outliers = df[mask]
-        outliers = pd.concat([outliers, iqr_outliers, z_outliers])
-    return outliers.drop_duplicates()
-
-def generate_visuals(df):
+        return None, None
+
+# === PREDICTIVE MODELING SETUP ===
+driver_target, driver_features, driver_task = None, [], None
+if analysis_mode == "Predictive Modeling" and uploaded_file:
+    preview, _ = load_data(uploaded_file)
+    if preview is not None:
+        d1, d2 = st.columns([1, 2])
+        driver_target = d1.selectbox("🎯 Target to explain (e.g. satisfaction, NPS)", list(preview.columns))
+        task_choice = d1.radio("Task", ["Auto", "Regression", "Classification"], horizontal=True,
+                               help="Auto treats numeric targets as regression unless they are binary")
+        driver_task = None if task_choice == "Auto" else task_choice.lower()
+        driver_features = d2.multiselect(
+            "Candidate drivers", [c for c in preview.columns if c != driver_target],
+            default=[c for c in preview.columns if c != driver_target]
+        )
+
+def distribution_figure(summary, i):
+    """Histogram with a marginal box plot, drawn from precomputed aggregates only"""
+    col, edges, counts = summary["columns"][i], summary["edges"][i], summary["counts"][i]
+    stats_row = summary["box"].iloc[i]
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.2, 0.8], vertical_spacing=0.02)
+    fig.add_trace(go.Box(
+        q1=[stats_row["q1"]], median=[stats_row["median"]], q3=[stats_row["q3"]],
+        lowerfence=[stats_row["whisker_low"]], upperfence=[stats_row["whisker_high"]],
+        y=[col], orientation="h", name=col, showlegend=False
+    ), row=1, col=1)
+    fig.add_trace(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges), name=col, showlegend=False
+    ), row=2, col=1)
+    fig.update_yaxes(showticklabels=False, row=1, col=1)
+    fig.update_yaxes(title_text="count", row=2, col=1)
+    fig.update_layout(title=f"{col} ({int(stats_row['outliers'])} outside whiskers)", bargap=0)
+    return fig
+
+def eda_results(data, corr, anomalies, corr_method, anomaly_method):
+    """Profile, correlations and anomaly scores of data (a sample, or all rows in the background)"""
+    results = {"profile": profile_dataset(data)}
+    if corr:
+        results["correlation"] = correlation_matrix(data, method=corr_method)
+    if anomalies:
+        results["anomalies"] = detect_anomalies(data, method=None if anomaly_method == "none" else anomaly_method)
+    return results
+
+@st.cache_resource
+def exact_executor():
+    # One worker, so exact passes queue instead of competing with each other for the cores
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="sami-exact")
+
+@st.fragment(run_every=2)
+def exact_progress(future):
+    if future.done():
+        st.rerun()
+    st.info("⏳ Showing estimates from a sample; exact results on all rows will replace them when ready.")
+
+def get_eda(df):
+    """Exact EDA results, or sample estimates while the exact pass runs in the background.
+
+    Returns (results, approx) where approx is None for exact results, else a
+    dict with the sample, its strata column and the population size.
+    """
+    settings = (show_corr, show_anomaly, corr_method, anomaly_method)
+    # The tolerance raises the sample size when the requested one is too small to meet it
+    n_sample = max(int(sample_rows), required_sample_size(error_tolerance, confidence_level))
+    if not sample_first or len(df) <= n_sample:
+        with st.spinner("Profiling dataset..."):
+            return eda_results(df, *settings), None
+
+    job_key = (run_key, settings)
+    job = st.session_state.get("exact_job")
+    if job is None or job[0] != job_key:
+        # A shallow copy shares the data; it only keeps columns added to df later on this run
+        # (e.g. clusters) from changing the frame under the job
+        job = (job_key, exact_executor().submit(eda_results, df.copy(deep=False), *settings))
+        st.session_state["exact_job"] = job
+    future = job[1]
+    if future.done() and future.exception() is None:
+        return future.result(), None
+    if future.done():
+        st.warning(f"Exact pass failed ({future.exception()}); showing sample estimates.")
+    else:
+        exact_progress(future)
+
+    sample_key = (job_key, n_sample, int(max_categories))
+    cached = st.session_state.get("sample_eda")
+    if cached is None or cached[0] != sample_key:
+        strata = choose_strata(df, int(max_categories))
+        sample = stratified_sample(df, n_sample, strata)
+        with st.spinner(f"Analyzing a {len(sample):,}-row sample..."):
+            cached = (sample_key, eda_results(sample, *settings),
+                      {"sample": sample, "strata": strata, "population": len(df)})
+        st.session_state["sample_eda"] = cached
+    return cached[1], cached[2]
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def pca_projection(data_key, _df, n_components):
+    """fit_pca once per dataset; data_key identifies _df, which is not hashed"""
+    return fit_pca(_df, n_components=n_components)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def cluster_assignment(data_key, _df, ks):
+    """Best-silhouette k and every row's cluster, once per dataset and range of k.
+
+    Returns (scores, k, labels, columns).
+    """
+    Z, cols, _, _ = standardize(_df)
+    fits, scores, k = select_k(cached_matrix(Z), ks)
+    return scores, k, assign_clusters(Z, fits[k]["centers"]), cols
+
+def generate_visuals(df, eda, approx=None):
+    profile = eda["profile"]
+    n_numeric = len(profile["distributions"]["columns"])
     if show_dist:
         st.subheader("📊 Feature Distributions")
-        for col in df.select_dtypes(include=np.number).columns[:5]:
-            fig = px.histogram(df, x=col, marginal="box", title=col)
-            st.plotly_chart(fig, use_container_width=True)
+        summary = profile["distributions"]
+        if approx:
+            st.caption(f"Estimated from {len(approx['sample']):,} of {approx['population']:,} rows; "
+                       "counts are sample counts.")
+        n_cols = len(summary["columns"])
+        if n_cols:
+            pages = range(0, n_cols, DIST_PER_PAGE)
+            first = st.selectbox(
+                "Columns", list(pages), key="dist_page",
+                format_func=lambda p: f"{p + 1}–{min(p + DIST_PER_PAGE, n_cols)} of {n_cols}: "
+                                      f"{summary['columns'][p]} … {summary['columns'][min(p + DIST_PER_PAGE, n_cols) - 1]}"
+            )
+            for i in range(first, min(first + DIST_PER_PAGE, n_cols)):
+                st.plotly_chart(distribution_figure(summary, i), use_container_width=True)
+            with st.expander("Summary statistics for all numeric columns"):
+                st.dataframe(summary["box"], use_container_width=True)
+                if approx:
+                    st.markdown(f"**{confidence_level:.0%} confidence intervals for the full data**")
+                    intervals = numeric_intervals(approx["sample"], confidence_level, approx["population"])
+                    st.dataframe(intervals.round(3), use_container_width=True)
 
     if show_corr:
         st.subheader("🔗 Correlation Matrix")
-        corr = df.select_dtypes(include=np.number).corr()
-        fig = px.imshow(corr, text_auto=".2f", color_continuous_scale="RdBu", range_color=[-1, 1])
-        st.plotly_chart(fig, use_container_width=True)
+        R, counts, cols = eda["correlation"]
+        if len(cols) >= 2:
+            pairs = top_pairs(R, cols, k=50, counts=counts)
+            if approx:
+                pairs["ci_low"], pairs["ci_high"] = correlation_intervals(pairs["r"], pairs["n"], confidence_level)
+                pairs["within_tolerance"] = (pairs["ci_high"] - pairs["ci_low"]) / 2 <= error_tolerance
+                st.caption(f"Estimated from a {len(approx['sample']):,}-row sample, with {confidence_level:.0%} "
+                           "confidence intervals for each pair.")
+            labels, order = correlation_blocks(R, cols)
+            if len(cols) <= CORR_MAX_COLUMNS:
+                shown = pd.DataFrame(R[np.ix_(order, order)], index=[cols[i] for i in order], columns=[cols[i] for i in order])
+            else:
+                shown = reduced_matrix(R, cols, pairs, order, max_columns=CORR_MAX_COLUMNS)
+                st.caption(f"Showing the {len(shown)} columns involved in the strongest pairs, of {len(cols)}.")
+            fig = px.imshow(shown, text_auto=".2f" if len(shown) <= CORR_ANNOTATE else False,
+                            color_continuous_scale="RdBu", range_color=[-1, 1])
+            st.plotly_chart(fig, use_container_width=True)
+            c1, c2 = st.columns(2)
+            c1.markdown("**Strongest pairs**")
+            c1.dataframe(pairs.round(3), use_container_width=True)
+            c2.markdown("**Correlated blocks** (|r| ≳ 0.5)")
+            c2.dataframe(block_summary(R, cols, labels), use_container_width=True)
+
+    if (show_pca and n_numeric >= 3) or (show_cluster and n_numeric >= 2):
+        # Numeric columns only, so the cluster column joined below does not change the key
+        data_key = dataset_key(df.select_dtypes(include=np.number))
 
-    if show_pca and len(df.select_dtypes(include=np.number).columns) >= 3:
+    if show_pca and n_numeric >= 3:
         st.subheader("🔮 PCA Projection")
-        pca = PCA(n_components=2)
-        proj = pca.fit_transform(df.select_dtypes(include=np.number).dropna())
-        fig = px.scatter(x=proj[:, 0], y=proj[:, 1], title="2D PCA Projection", labels={'x': "PC1", 'y': "PC2"})
+        with st.spinner("Fitting principal components..."):
+            pca = pca_projection(data_key, df, min(5, n_numeric))
+        proj = pca["projection"]
+        if len(proj) <= SCATTER_MAX_POINTS:
+            fig = px.scatter(x=proj[:, 0], y=proj[:, 1], title="2D PCA Projection", labels={'x': "PC1", 'y': "PC2"})
+        else:
+            # Too many points to ship to the browser: bin them here and draw the grid
+            counts, xs, ys = density_grid(proj[:, 0], proj[:, 1])
+            fig = px.imshow(np.log1p(counts), x=xs, y=ys, origin="lower", aspect="auto",
+                            color_continuous_scale="Viridis", labels={'x': "PC1", 'y': "PC2", 'color': "log(1 + rows)"},
+                            title=f"2D PCA Density ({len(proj):,} rows)")
         st.plotly_chart(fig, use_container_width=True)
+        c1, c2 = st.columns([1, 2])
+        c1.dataframe((100 * pca["explained_variance_ratio"]).round(1).rename("% variance explained"))
+        c2.dataframe(pca["loadings"].round(3), use_container_width=True)
+
+    if show_cluster and n_numeric >= 2:
+        st.subheader("🧭 Clustering")
+        with st.spinner("Fitting candidate cluster counts in parallel..."):
+            scores, k, labels, cols = cluster_assignment(
+                data_key, df, tuple(range(cluster_range[0], cluster_range[1] + 1))
+            )
+        st.dataframe(scores, use_container_width=True)
+        st.markdown(f"**{k} clusters** (best silhouette on a {min(len(df), 10_000):,}-row sample)")
+        st.dataframe(cluster_profiles(df, labels, cols).round(2), use_container_width=True)
+        # Join labels onto the loaded data; categorical so later numeric summaries skip it
+        df["cluster"] = pd.Categorical(labels + 1)
+        st.session_state.df = df
+        st.dataframe(df.head(), use_container_width=True)
 
 # === MAIN ANALYSIS ===
 def run_analysis(df):
+    # One cached pass over the data (or a sample of it) feeds the overview, the charts and the GPT prompt
+    eda, approx = get_eda(df)
+    profile = eda["profile"]
     with st.expander("📋 Data Overview", expanded=True):
         c1, c2, c3 = st.columns(3)
         c1.metric("Rows", df.shape[0])
         c2.metric("Columns", df.shape[1])
-        c3.metric("Missing %", f"{df.isnull().mean().mean()*100:.1f}%")
+        c3.metric("Missing %" + (" (est.)" if approx else ""), f"{profile['columns']['missing_pct'].mean():.1f}%")
         st.dataframe(df.head(3))
+        if approx:
+            strata = f", stratified by {approx['strata']}" if approx["strata"] is not None else ""
+            st.caption(f"Estimates from a {len(approx['sample']):,}-row sample{strata}.")
+        st.markdown("**Column profile**")
+        st.dataframe(profile["columns"].drop(columns=["top", "freq"]).round(3), use_container_width=True)
+
+    generate_visuals(df, eda, approx)
 
-    generate_visuals(df)
+    if analysis_mode == "Predictive Modeling" and driver_target and driver_features:
+        st.subheader("🎯 Key Driver Analysis")
+        try:
+            with st.spinner("Fitting driver model on all cores..."):
+                drivers = fit_drivers(df, driver_target, driver_features, max_categories=int(max_categories),
+                                      task=driver_task)
+            metric = "Holdout R²" if drivers["task"] == "regression" else "Holdout accuracy"
+            st.metric(metric, f"{drivers['score']:.3f}")
+            importance = drivers["importance"]
+            top = importance.head(20).iloc[::-1]
+            fig = px.bar(top, x="importance", y=top.index, error_x="std", orientation="h",
+                         labels={"importance": "Permutation importance (score drop)", "y": ""},
+                         title=f"What drives {driver_target}")
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(importance.round(4), use_container_width=True)
+        except Exception as e:
+            st.error(f"Driver analysis error: {e}")
 
     if show_anomaly:
-        anomalies = detect_anomalies(df)
-        if not anomalies.empty:
-            st.warning(f"⚠️ {len(anomalies)} anomalies detected")
+        scores, reasons = eda["anomalies"]
+        flagged = scores[scores["is_anomaly"]]
+        if not flagged.empty and approx:
+            population = approx["population"]
+            _, low, high = proportion_interval(len(flagged), len(scores), confidence_level, population)
+            st.warning(f"⚠️ ~{len(flagged) / len(scores) * population:,.0f} anomalous rows estimated "
+                       f"({low * population:,.0f}–{high * population:,.0f} at {confidence_level:.0%}); "
+                       f"{len(flagged)} flagged in the sample")
+        elif not flagged.empty:
+            st.warning(f"⚠️ {len(flagged)} anomalous rows detected")
             with st.expander("View Anomalies"):
-                st.dataframe(anomalies)
+                st.dataframe(reasons.sum().rename("rows flagged").to_frame().T, use_container_width=True)
+                order = ["multivariate_score", "n_flags"] if "multivariate_score" in flagged else ["n_flags", "max_abs_z"]
+                top = flagged.sort_values(order, ascending=False).head(500)
+                st.caption(f"Top {len(top)} rows by anomaly score")
+                st.dataframe(
+                    pd.concat([top, reason_labels(reasons.loc[top.index]).rename("reasons"), df.loc[top.index]], axis=1)
+                )
 
-    if client:
+    if llm_available():
         try:
             try:
-                desc = df.describe().to_markdown()
+                desc = profile_table(profile).to_markdown()
             except:
-                desc = df.describe().to_string()
+                desc = profile_table(profile).to_string()
 
             summary = f"""
 Data shape: {df.shape}
 Columns: {list(df.columns)}
-Stats:
+Column profile{f" (estimated from a {len(approx['sample']):,}-row sample)" if approx else ""}:
 {desc}
 """
 
             with st.spinner("🧠 Generating AI insights..."):
-                response = client.chat.completions.create(
+                answer = chat_completion(
                     model="gpt-3.5-turbo",
                     messages=[
                         {"role": "system", "content": "You're a senior data analyst. Focus on: key patterns, implications, next steps."},
                         {"role": "user", "content": f"{user_prompt or 'Analyze this dataset'}:\n{summary}"}
-                    ]
+                    ],
+                    module="SAMI"
                 )
-                answer = response.choices[0].message.content
                 st.subheader("💡 GPT Insights")
                 st.markdown(answer)
 
@@ -187,9 +410,16 @@ Stats:
         st.info("GPT not initialized")
 
 # === EXECUTION ===
+# Remember the run so widgets in the results (e.g. distribution pages) can rerun it
+run_key = uploaded_file.file_id if uploaded_file else None
 if st.button("🚀 Run Analysis") and uploaded_file:
-    df = load_data(uploaded_file)
+    st.session_state["sami_run"] = run_key
+if uploaded_file and st.session_state.get("sami_run") == run_key:
+    df, load_report = load_data(uploaded_file)
     if df is not None:
+        st.caption(memory_caption(load_report))
+        with st.expander("Column types and memory"):
+            st.dataframe(load_report, use_container_width=True)
         st.session_state.df = df
         run_analysis(df)
 elif uploaded_file and st.session_state.df is not None:
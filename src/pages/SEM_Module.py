@@ -3,7 +3,8 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from semopy import Model, Optimizer
-from openai import OpenAI
+from utils.gpt_helpers import chat_completion
+from utils.loader import load_table, memory_caption
 import os
 from fpdf import FPDF
 from io import BytesIO
@@ -13,9 +14,6 @@ st.set_page_config(page_title="Structural Equation Modeling", layout="wide")
 st.title("🧩 Structural Equation Modeling (SEM)")
 st.markdown("Estimate latent and observed relationships using SEM. Upload your data and specify the model using lavaan-style syntax.")
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 # Sidebar – file upload and model input
 st.sidebar.header("📅 Input Options")
 uploaded_file = st.sidebar.file_uploader("Upload CSV or Excel file", type=["csv", "xlsx"])
@@ -24,8 +22,9 @@ model_spec = st.sidebar.text_area("✍️ SEM Model Specification (lavaan-style)
 # Load and preview data
 if uploaded_file:
     try:
-        df = pd.read_excel(uploaded_file) if uploaded_file.name.endswith("xlsx") else pd.read_csv(uploaded_file)
+        df, load_report = load_table(uploaded_file, downcast=False)
         st.success(f"✅ File loaded: {df.shape[0]} rows × {df.shape[1]} columns")
+        st.caption(memory_caption(load_report))
         st.subheader("🔍 Data Preview")
         st.dataframe(df.head(), use_container_width=True)
     except Exception as e:
@@ -67,14 +66,14 @@ if df is not None and model_spec:
 {estimates.to_string(index=False)}
 
 Summarize key findings, path significance, and strategic implications."""
-                response = client.chat.completions.create(
+                insights = chat_completion(
                     model="gpt-3.5-turbo",
                     messages=[
                         {"role": "system", "content": "You are a SEM analyst interpreting structural equation model output."},
                         {"role": "user", "content": prompt}
-                    ]
+                    ],
+                    module="SEM"
                 )
-                insights = response.choices[0].message.content
                 st.subheader("💬 GPT Interpretation")
                 st.markdown(insights)
 
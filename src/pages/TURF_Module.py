@@ -1,37 +1,61 @@
 import streamlit as st
 import pandas as pd
-import itertools
 import matplotlib.pyplot as plt
 import os
-from openai import OpenAI
+from utils.gpt_helpers import chat_completion
+from utils.loader import load_table, memory_caption
 from fpdf import FPDF
 from io import BytesIO
+from utils.turf import run_turf, run_turf_heuristic, shapley_reach, bootstrap_turf
 
 st.set_page_config(page_title="TURF Analysis", layout="wide")
 st.title("📡 TURF Analysis Module")
 
 st.markdown("Upload binary (1/0) coded data to identify optimal item combinations that maximize reach.")
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 uploaded_file = st.file_uploader("Upload CSV or Excel file with 1/0 columns", type=["csv", "xlsx"])
 
 if uploaded_file:
-    df = pd.read_excel(uploaded_file) if uploaded_file.name.endswith("xlsx") else pd.read_csv(uploaded_file)
+    df, load_report = load_table(uploaded_file)
     st.success(f"Loaded {df.shape[0]} rows and {df.shape[1]} columns.")
+    st.caption(memory_caption(load_report))
     st.dataframe(df.head())
 
     turf_cols = st.multiselect("Select columns to include in TURF analysis", df.columns)
     max_combo = st.slider("Maximum number of items in a combination", 2, min(10, len(turf_cols)), 3)
 
+    search_mode = st.radio(
+        "Search mode",
+        ["Exact (all combinations)", "Heuristic (large item sets)"],
+        index=1 if len(turf_cols) > 30 else 0,
+        horizontal=True
+    )
+    if search_mode.startswith("Heuristic"):
+        time_budget = st.number_input("Time budget (seconds)", 1, 300, 10)
+
+    run_bootstrap = st.checkbox("Bootstrap confidence intervals for reach and item importance")
+    if run_bootstrap:
+        n_boot = st.number_input("Bootstrap resamples", 100, 10000, 1000, step=100)
+
     if st.button("Run TURF Analysis"):
-        def turf_score(combo):
-            reach = (df[list(combo)].sum(axis=1) > 0).mean()
-            return round(reach * 100, 2)
+        if search_mode.startswith("Exact"):
+            with st.spinner("Scoring combinations..."):
+                turf_df = run_turf(df, turf_cols, max_combo, top_k=10)
+
+            st.subheader("📈 Best Reach by Combination Size")
+            best_by_size = turf_df.groupby("size").head(1)[["size", "combo", "reach"]]
+            st.dataframe(best_by_size, use_container_width=True)
+
+            results = turf_df[turf_df["size"] == max_combo][["combo", "reach"]].to_dict(orient="records")
+        else:
+            with st.spinner("Searching portfolios..."):
+                turf_df = run_turf_heuristic(df, turf_cols, max_combo, time_budget=time_budget)
 
-        all_combos = list(itertools.combinations(turf_cols, max_combo))
-        results = [{"combo": c, "reach": turf_score(c)} for c in all_combos]
-        results = sorted(results, key=lambda x: x["reach"], reverse=True)
+            st.subheader("📈 Best Portfolio by Size")
+            st.caption("Upper bound is the highest reach any portfolio of that size could achieve; gap is the distance to it.")
+            st.dataframe(turf_df, use_container_width=True)
+
+            results = turf_df.sort_values("size", ascending=False)[["combo", "reach"]].to_dict(orient="records")
 
         top_result = results[0]
         st.subheader("🏆 Top Combination")
@@ -51,19 +75,37 @@ if uploaded_file:
         ax.set_title("Top TURF Combinations")
         st.pyplot(fig)
 
+        st.subheader("🧩 Item Importance (Shapley Reach)")
+        if run_bootstrap:
+            with st.spinner("Bootstrapping reach and item importance..."):
+                shapley_df, reach_ci = bootstrap_turf(df, turf_cols, combos=top_df["combo"], n_boot=int(n_boot))
+            st.dataframe(shapley_df, use_container_width=True)
+            st.markdown("**Reach with 95% confidence intervals:**")
+            st.dataframe(reach_ci, use_container_width=True)
+        else:
+            shapley_df = shapley_reach(df, turf_cols).round(2).to_frame()
+            st.dataframe(shapley_df, use_container_width=True)
+
+        fig, ax = plt.subplots()
+        shapley_sorted = shapley_df["shapley"].iloc[::-1]
+        ax.barh([str(i) for i in shapley_sorted.index], shapley_sorted.values)
+        ax.set_xlabel("Share of total reach (%)")
+        ax.set_title("Item Contribution to Reach")
+        st.pyplot(fig)
+
         gpt_insight = ""
         prompt = f"Here are the top TURF combinations and their reach values:\n{top_df.to_string(index=False)}"
         try:
             with st.spinner("GPT interpreting TURF results..."):
-                response = client.chat.completions.create(
+                gpt_insight = chat_completion(
                     model="gpt-3.5-turbo",
                     messages=[
                         {"role": "system", "content": "You are a TURF analysis expert."},
                         {"role": "user", "content": "Please explain the optimal strategy and implications for these TURF results."},
                         {"role": "user", "content": prompt}
-                    ]
+                    ],
+                    module="TURF"
                 )
-                gpt_insight = response.choices[0].message.content
                 st.subheader("💬 GPT Insight")
                 st.markdown(gpt_insight)
         except Exception as e:
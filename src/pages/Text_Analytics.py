@@ -1,63 +1,213 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
-from openai import OpenAI
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.decomposition import NMF
+import tempfile
+from utils import cache
+from utils.dedup import dedupe_texts
+from utils.loader import load_table, memory_caption
+from utils.sentiment import cached_sentiment, sentiment_summary
+from utils.summarize import map_reduce_summarize
+from utils.topics import (
+    iter_text_chunks, stream_topics, cached_dtm, corpus_key, select_topic_count, load_counts, term_frequencies
+)
+from utils.wordclouds import cached_wordcloud
 
 st.set_page_config(page_title="Text Analytics", layout="wide")
 st.title("📝 Text Analytics Module – Sentiment & Topic Modeling")
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 uploaded_file = st.file_uploader("Upload your dataset with open-ended text", type=["csv", "xlsx"])
-method = st.selectbox("Choose Topic Modeling Method", ["GPT Summary", "TF-IDF + NMF Topics"])
+method = st.selectbox("Choose Topic Modeling Method", ["GPT Summary", "TF-IDF + NMF Topics", "Streaming TF-IDF + NMF (large files)"])
 text_col = st.text_input("Column name containing text responses")
+if method.startswith("Streaming"):
+    c1, c2 = st.columns(2)
+    n_topics = c1.number_input("Number of topics", 2, 50, 5)
+    max_features = c2.number_input("Vocabulary size", 200, 50000, 2000, step=100)
+elif method == "TF-IDF + NMF Topics":
+    k_min, k_max = st.slider("Topic counts to compare", 2, 20, (3, 10))
+if not method.startswith("Streaming"):
+    collapse = st.checkbox("Collapse near-duplicate responses", value=True,
+                           help="Groups copy-paste and near-identical answers and analyzes each group once, weighted by its size.")
 
-if uploaded_file and text_col and st.button("Analyze Text"):
-    try:
-        df = pd.read_csv(uploaded_file) if uploaded_file.name.endswith(".csv") else pd.read_excel(uploaded_file)
-        if text_col not in df.columns:
-            st.error("❌ Column not found.")
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def collapse_responses(responses):
+    return dedupe_texts(responses)
+
+
+def prepare_corpus(uploaded_file, text_col, collapse):
+    """Parse, collapse and score the responses once per upload/column/setting.
+
+    Kept in session state, so widget changes (topic count, word cloud and
+    segment selectors) rerun the page without re-reading the file or
+    re-hashing the corpus. Sentiment is scored per response, not per collapsed
+    text, since a near-duplicate group can hold wordings the scorer tells apart.
+    """
+    key = (uploaded_file.file_id, text_col, collapse)
+    corpus = st.session_state.get("text_corpus")
+    if corpus is not None and corpus["key"] == key:
+        return corpus
+    df, load_report = load_table(uploaded_file)
+    corpus = {"key": key, "df": df, "load_report": load_report}
+    if text_col in df.columns:
+        answered = df[text_col].notna()
+        responses = df.loc[answered, text_col].astype(str).tolist()
+        if collapse:
+            with st.spinner("Collapsing near-duplicate responses..."):
+                texts, multiplicity, labels = collapse_responses(responses)
         else:
-            responses = df[text_col].dropna().astype(str).tolist()
-            full_text = "\n".join(responses[:100])  # Limit for speed
-            st.success(f"Loaded {len(responses)} responses.")
-
-            if method == "GPT Summary":
-                with st.spinner("Using GPT to summarize themes..."):
-                    system_prompt = f"You are a text analysis assistant. Analyze the following open-ended survey responses and summarize key topics, common themes, and emotional sentiment."
-                    response = client.chat.completions.create(
-                        model="gpt-3.5-turbo",
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": full_text}
-                        ]
-                    )
-                    st.subheader("📚 GPT Topic Summary")
-                    st.markdown(response.choices[0].message.content)
-
-            elif method == "TF-IDF + NMF Topics":
-                st.subheader("🧠 TF-IDF Topic Modeling (NMF)")
-                tfidf = TfidfVectorizer(stop_words="english", max_features=500)
-                tfidf_matrix = tfidf.fit_transform(responses)
-                nmf = NMF(n_components=5, random_state=42)
-                W = nmf.fit_transform(tfidf_matrix)
-                H = nmf.components_
-                feature_names = tfidf.get_feature_names_out()
-
-                for topic_idx, topic in enumerate(H):
-                    st.markdown(f"**Topic {topic_idx+1}:** " + ", ".join([feature_names[i] for i in topic.argsort()[:-6:-1]]))
-
-                st.subheader("☁️ Word Cloud")
-                wordcloud = WordCloud(width=800, height=300, background_color="white").generate(full_text)
-                fig, ax = plt.subplots(figsize=(10, 3))
-                ax.imshow(wordcloud, interpolation="bilinear")
-                ax.axis("off")
-                st.pyplot(fig)
+            texts, multiplicity, labels = responses, None, np.arange(len(responses))
+        corpus.update(answered=answered, n_responses=len(responses), texts=texts, multiplicity=multiplicity,
+                      labels=labels, sentiment=cached_sentiment(responses))
+    st.session_state["text_corpus"] = corpus
+    return corpus
+
+
+if uploaded_file and text_col and method.startswith("Streaming") and st.button("Analyze Text"):
+    try:
+        status = st.empty()
+        out_path = os.path.join(tempfile.gettempdir(), f"topics_{os.getpid()}_{uploaded_file.file_id}.csv")
+        result = stream_topics(
+            lambda: iter_text_chunks(uploaded_file, text_col),
+            out_path, n_topics=int(n_topics), max_features=int(max_features),
+            on_progress=lambda stage: status.info(f"⏳ {stage}...")
+        )
+        status.success(f"Modeled {result['n_docs']} responses.")
+
+        st.subheader("🧠 Streaming Topic Modeling (Mini-batch NMF)")
+        for topic_idx, terms in enumerate(result["top_terms"]):
+            st.markdown(f"**Topic {topic_idx+1}** ({result['topic_sizes'][topic_idx]} responses): " + ", ".join(terms[:5]))
 
+        with open(out_path, "rb") as f:
+            st.download_button("📥 Download topic assignments (CSV)", f, file_name="topic_assignments.csv", mime="text/csv")
+    except KeyError:
+        st.error("❌ Column not found.")
     except Exception as e:
         st.error(f"Error: {e}")
+
+elif uploaded_file and text_col and not method.startswith("Streaming"):
+    # Remember the run so widgets below (e.g. topic count) can rerun without re-clicking
+    run_key = (uploaded_file.file_id, text_col, method)
+    if st.button("Analyze Text"):
+        st.session_state["text_run"] = run_key
+    if st.session_state.get("text_run") == run_key:
+        try:
+            corpus = prepare_corpus(uploaded_file, text_col, collapse)
+            df = corpus["df"]
+            if text_col not in df.columns:
+                st.error("❌ Column not found.")
+            else:
+                answered, texts, multiplicity, labels, per_response = (
+                    corpus[k] for k in ("answered", "texts", "multiplicity", "labels", "sentiment")
+                )
+                if collapse:
+                    st.success(f"Loaded {corpus['n_responses']} responses ({len(texts)} distinct after collapsing near-duplicates).")
+                else:
+                    st.success(f"Loaded {corpus['n_responses']} responses.")
+                st.caption(memory_caption(corpus["load_report"]))
+                topic_of = None
+
+                if method == "GPT Summary":
+                    with st.spinner("Using GPT to summarize themes across all responses..."):
+                        system_prompt = f"You are a text analysis assistant. Analyze the following open-ended survey responses and summarize key topics, common themes, and emotional sentiment."
+                        progress = st.progress(0.0, text="Summarizing response chunks...")
+                        summary = map_reduce_summarize(
+                            texts, system_prompt, model="gpt-3.5-turbo", module="Text", weights=multiplicity,
+                            on_progress=lambda stage, done, total: progress.progress(done / total, text=f"{stage}: {done}/{total}")
+                        )
+                        st.subheader("📚 GPT Topic Summary")
+                        st.markdown(summary)
+
+                elif method == "TF-IDF + NMF Topics":
+                    st.subheader("🧠 TF-IDF Topic Modeling (NMF)")
+                    if "dtm" not in corpus:
+                        corpus["dtm"] = cached_dtm(texts, max_features=500, weights=multiplicity)
+                        corpus["corpus_key"] = corpus_key(texts, 500, multiplicity)
+                    path, tfidf_matrix, feature_names = corpus["dtm"]
+                    with st.spinner("Fitting candidate topic counts in parallel..."):
+                        fits, scores, recommended = select_topic_count(path, range(k_min, k_max + 1))
+                    st.dataframe(scores, use_container_width=True)
+                    n_topics = st.selectbox(
+                        "Number of topics to display", list(scores["k"]),
+                        index=list(scores["k"]).index(recommended),
+                        format_func=lambda k: f"{k} (recommended)" if k == recommended else str(k),
+                        key="topic_k"
+                    )
+                    H = fits[n_topics]["H"]
+                    W = fits[n_topics]["W"]
+                    # Dominant topic per distinct text; 0 when it has no known terms
+                    topic_of = np.where(W.max(axis=1) > 0, W.argmax(axis=1) + 1, 0)
+
+                    for topic_idx, topic in enumerate(H):
+                        st.markdown(f"**Topic {topic_idx+1}:** " + ", ".join([feature_names[i] for i in topic.argsort()[:-6:-1]]))
+
+                    st.subheader("☁️ Word Cloud")
+                    # Term counts come from the cached matrix, so clouds never re-tokenize the text
+                    counts, _ = load_counts(path)
+                    c1, c2 = st.columns(2)
+                    cloud_topic = c1.selectbox(
+                        "Responses", ["All"] + [f"Topic {i + 1}" for i in range(len(H))], key="cloud_topic"
+                    )
+                    segment_col = c2.selectbox(
+                        "Split by segment (optional)", ["None"] + [c for c in df.columns if c != text_col],
+                        key="cloud_segment"
+                    )
+                    # Rows of the matrix are distinct texts; weight them back up to responses
+                    share = 1.0 if cloud_topic == "All" else fits[n_topics]["W"][:, int(cloud_topic.split()[1]) - 1]
+                    weights = (np.ones(len(texts)) if multiplicity is None else multiplicity) * share
+                    key = corpus["corpus_key"]
+                    subset = cloud_topic if cloud_topic == "All" else f"k{n_topics} {cloud_topic}"
+
+                    if segment_col == "None":
+                        freqs = term_frequencies(counts, feature_names, weights=weights)
+                        if freqs:
+                            st.image(cached_wordcloud(key, subset, freqs), use_container_width=True)
+                        else:
+                            st.info("No terms to display.")
+                    else:
+                        segments = df.loc[answered, segment_col].astype(str).to_numpy()
+                        values = pd.Series(segments).value_counts().index[:12]
+                        if len(values) < pd.Series(segments).nunique():
+                            st.caption(f"Showing the {len(values)} largest segments.")
+                        cols = st.columns(2)
+                        for i, value in enumerate(values):
+                            in_segment = np.bincount(labels[segments == value], minlength=len(texts))
+                            freqs = term_frequencies(counts, feature_names, weights=in_segment * share)
+                            # Key on segment membership too, so recoding the segment column redraws the cloud
+                            members = cache.content_key(in_segment.tobytes())
+                            with cols[i % 2]:
+                                st.markdown(f"**{segment_col} = {value}** ({int((segments == value).sum())} responses)")
+                                if freqs:
+                                    st.image(
+                                        cached_wordcloud(key, f"{subset} | {segment_col}={value} | {members}", freqs, width=600),
+                                        use_container_width=True
+                                    )
+                                else:
+                                    st.caption("No terms to display.")
+
+                st.subheader("💬 Sentiment")
+                overall = sentiment_summary(per_response, np.zeros(len(per_response), dtype=int)).iloc[0]
+                m1, m2, m3, m4 = st.columns(4)
+                m1.metric("Mean sentiment", f"{overall['mean_sentiment']:+.2f}")
+                m2.metric("Positive", f"{overall['% positive']:.1f}%")
+                m3.metric("Neutral", f"{overall['% neutral']:.1f}%")
+                m4.metric("Negative", f"{overall['% negative']:.1f}%")
+                if topic_of is not None:
+                    st.markdown("**By topic**")
+                    by_topic = sentiment_summary(per_response, topic_of[labels])
+                    by_topic.index = [f"Topic {t}" if t else "No topic" for t in by_topic.index]
+                    st.dataframe(by_topic, use_container_width=True)
+                sentiment_segment = st.selectbox(
+                    "Sentiment by segment", ["None"] + [c for c in df.columns if c != text_col], key="sentiment_segment"
+                )
+                if sentiment_segment != "None":
+                    segments = df.loc[answered, sentiment_segment].astype(str).to_numpy()
+                    st.dataframe(sentiment_summary(per_response, segments), use_container_width=True)
+                scored = df.loc[answered].assign(sentiment=per_response["sentiment"].to_numpy(),
+                                                  sentiment_label=per_response["label"].to_numpy())
+                st.download_button("📥 Download per-response sentiment (CSV)", scored.to_csv(index=False),
+                                   file_name="sentiment_scores.csv", mime="text/csv")
+
+        except Exception as e:
+            st.error(f"Error: {e}")
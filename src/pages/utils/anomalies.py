@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+MULTIVARIATE_METHODS = ("isolation_forest", "mahalanobis")
+
+
+def univariate_flags(X, iqr_k=1.5, z_threshold=3.0):
+    """IQR and z-score outlier masks for every column of X at once.
+
+    X is a float array with NaN for missing values; NaNs are never flagged and
+    do not shift other rows (quantiles and moments ignore them per column).
+    Returns (iqr_mask, z_mask, abs_z).
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        q1, q3 = np.nanquantile(X, [0.25, 0.75], axis=0)
+        spread = q3 - q1
+        iqr_mask = (X < q1 - iqr_k * spread) | (X > q3 + iqr_k * spread)
+        sd = np.nanstd(X, axis=0)
+        abs_z = np.abs(X - np.nanmean(X, axis=0)) / np.where(sd > 0, sd, np.nan)
+    z_mask = np.nan_to_num(abs_z, nan=0.0) > z_threshold
+    return iqr_mask, z_mask, abs_z
+
+
+def _standardize(X):
+    """Median-impute and robust-scale columns so one detector can see all of them.
+
+    All-missing and constant columns carry no signal (and would leave NaN or
+    singular covariances), so they are dropped; Z may have no columns left.
+    """
+    X = X[:, ~np.isnan(X).all(axis=0)]
+    median = np.nanmedian(X, axis=0)
+    X = np.where(np.isnan(X), median, X)
+    scale = stats.iqr(X, axis=0)
+    scale = np.where(scale > 0, scale, X.std(axis=0))
+    keep = scale > 0
+    return (X[:, keep] - median[keep]) / scale[keep]
+
+
+def multivariate_scores(X, method="isolation_forest", n_jobs=-1, random_state=0, max_fit_rows=5_000,
+                        alpha=0.001):
+    """Per-row multivariate outlier score (higher is more unusual) and flag.
+
+    isolation_forest trains its trees in parallel on all cores; mahalanobis
+    uses a Minimum Covariance Determinant fit on at most max_fit_rows rows and
+    flags distances beyond the chi-square 1 - alpha quantile. Rows score 0 and
+    are never flagged when no column varies.
+    """
+    Z = _standardize(X)
+    if Z.shape[1] == 0:
+        return np.zeros(len(Z)), np.zeros(len(Z), dtype=bool)
+    if method == "isolation_forest":
+        from sklearn.ensemble import IsolationForest
+        forest = IsolationForest(n_estimators=200, contamination="auto", n_jobs=n_jobs, random_state=random_state)
+        raw = forest.fit(Z).score_samples(Z)
+        # Same rule as forest.predict, without scoring every row twice
+        return -raw, raw < forest.offset_
+    if method == "mahalanobis":
+        from sklearn.covariance import MinCovDet
+        rng = np.random.default_rng(random_state)
+        sample = Z if len(Z) <= max_fit_rows else Z[rng.choice(len(Z), max_fit_rows, replace=False)]
+        distance = MinCovDet(random_state=random_state).fit(sample).mahalanobis(Z)
+        return distance, distance > stats.chi2.ppf(1 - alpha, Z.shape[1])
+    raise ValueError(f"Unknown multivariate method: {method}")
+
+
+def detect_anomalies(df, iqr_k=1.5, z_threshold=3.0, method="isolation_forest", n_jobs=-1):
+    """Score every row of df for anomalies across all numeric columns.
+
+    Returns (scores, reasons), both indexed like df:
+    - scores: n_flags (univariate flags on the row), max_abs_z,
+      multivariate_score (when method is set) and is_anomaly
+    - reasons: boolean mask with a "<col> (IQR)" and "<col> (z)" column per
+      numeric column, plus "multivariate"
+    """
+    numeric = df.select_dtypes(include=np.number)
+    X = numeric.to_numpy(dtype=np.float64, na_value=np.nan)
+    iqr_mask, z_mask, abs_z = univariate_flags(X, iqr_k, z_threshold)
+
+    reasons = pd.DataFrame(
+        np.concatenate([iqr_mask, z_mask], axis=1),
+        index=df.index,
+        columns=[f"{c} (IQR)" for c in numeric.columns] + [f"{c} (z)" for c in numeric.columns],
+    )
+    scores = pd.DataFrame({
+        "n_flags": reasons.sum(axis=1).to_numpy(),
+        "max_abs_z": pd.DataFrame(abs_z).max(axis=1).to_numpy(),
+    }, index=df.index)
+
+    if method and numeric.shape[1] >= 2 and len(numeric) > numeric.shape[1]:
+        score, flag = multivariate_scores(X, method, n_jobs=n_jobs)
+        scores["multivariate_score"] = score
+        reasons["multivariate"] = flag
+    scores["is_anomaly"] = reasons.any(axis=1)
+    return scores, reasons
+
+
+def reason_labels(reasons):
+    """Comma-separated reasons per row of a reason mask (for display)"""
+    names = np.array(reasons.columns, dtype=object)
+    return pd.Series([", ".join(names[row]) for row in reasons.to_numpy()], index=reasons.index)
@@ -0,0 +1,107 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_argmin, silhouette_score
+from utils import cache
+
+# Bump when the cached matrix or fit format changes
+CLUSTERING_VERSION = "1"
+_CACHE_NAMESPACE = "clustering"
+
+
+def standardize(df, columns=None):
+    """Median-imputed, z-scored float32 matrix of the numeric columns of df.
+
+    Returns (Z, columns, means, stds) so cluster centers can be mapped back
+    to the original units.
+    """
+    numeric = df[columns] if columns is not None else df.select_dtypes(include=np.number)
+    X = numeric.to_numpy(dtype=np.float32, na_value=np.nan)
+    median = np.nanmedian(X, axis=0)
+    X = np.where(np.isnan(X), median, X)
+    means, stds = X.mean(axis=0), X.std(axis=0)
+    stds = np.where(stds > 0, stds, 1.0).astype(np.float32)
+    return (X - means) / stds, list(numeric.columns), means, stds
+
+
+def cached_matrix(Z):
+    """Save Z once per content so worker processes can memory-map it. Returns the directory"""
+    Z = np.ascontiguousarray(Z, dtype=np.float32)
+    path = cache.entry_path(_CACHE_NAMESPACE, cache.content_key(Z.tobytes(), Z.shape, CLUSTERING_VERSION))
+    if not os.path.isdir(path):
+        staged = cache.staging_dir(_CACHE_NAMESPACE)
+        np.save(os.path.join(staged, "Z.npy"), Z)
+        cache.commit_dir(staged, path)
+        cache.evict_lru(_CACHE_NAMESPACE)
+    cache.touch(path)
+    return path
+
+
+def _fit_k(path, k, sample_size=10_000, batch_size=4096, random_state=42):
+    """Mini-batch k-means with k clusters on the cached matrix; reuse a saved fit when present"""
+    fit_path = os.path.join(path, f"kmeans_k{k}_s{sample_size}.npz")
+    if os.path.exists(fit_path):
+        saved = np.load(fit_path)
+        return {key: saved[key] for key in saved.files}
+    Z = np.load(os.path.join(path, "Z.npy"), mmap_mode="r")
+    model = MiniBatchKMeans(n_clusters=k, batch_size=batch_size, n_init=3, random_state=random_state).fit(Z)
+    # Same sample for every k, so silhouettes are comparable
+    rng = np.random.default_rng(random_state)
+    sample = np.sort(rng.choice(len(Z), min(sample_size, len(Z)), replace=False))
+    Zs = np.asarray(Z[sample])
+    labels = model.predict(Zs)
+    fit = {
+        "centers": model.cluster_centers_.astype(np.float32),
+        "inertia": np.float64(model.inertia_),
+        "silhouette": np.float64(silhouette_score(Zs, labels) if len(np.unique(labels)) > 1 else -1.0),
+    }
+    tmp = f"{fit_path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, **fit)
+    os.replace(tmp, fit_path)
+    return fit
+
+
+def select_k(path, ks, sample_size=10_000, n_jobs=None):
+    """Fit every k in ks in parallel worker processes and recommend the best silhouette.
+
+    Silhouette is computed on a fixed random sample of sample_size rows, so
+    selection cost does not grow with the data. Fits are saved next to the
+    cached matrix. Returns (fits keyed by k, scores DataFrame, recommended k).
+    """
+    ks = sorted(set(int(k) for k in ks))
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(ks))
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            fits = dict(zip(ks, pool.map(_fit_k, [path] * len(ks), ks, [sample_size] * len(ks))))
+    else:
+        fits = {k: _fit_k(path, k, sample_size) for k in ks}
+    cache.touch(path)
+
+    scores = pd.DataFrame({
+        "k": ks,
+        "silhouette": [float(fits[k]["silhouette"]) for k in ks],
+        "inertia": [float(fits[k]["inertia"]) for k in ks],
+    })
+    recommended = int(scores["k"][scores["silhouette"].idxmax()])
+    scores["recommended"] = scores["k"] == recommended
+    return fits, scores, recommended
+
+
+def assign_clusters(Z, centers, chunk_rows=200_000):
+    """Nearest-center label for every row, in bounded-memory chunks"""
+    labels = np.empty(len(Z), dtype=np.int32)
+    for start in range(0, len(Z), chunk_rows):
+        labels[start:start + chunk_rows] = pairwise_distances_argmin(Z[start:start + chunk_rows], centers)
+    return labels
+
+
+def cluster_profiles(df, labels, columns):
+    """Size, share and mean of each numeric column per cluster (clusters numbered from 1)"""
+    grouped = df[columns].groupby(labels + 1)
+    profiles = grouped.mean()
+    profiles.insert(0, "% of rows", (100 * grouped.size() / len(df)).round(1))
+    profiles.insert(0, "rows", grouped.size())
+    profiles.index.name = "cluster"
+    return profiles
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import fcluster, leaves_list, linkage
+from scipy.spatial.distance import squareform
+
+
+def correlation_matrix(df, method="pearson", block_cols=512, chunk_rows=100_000):
+    """Pairwise-complete Pearson or Spearman correlations of all numeric columns.
+
+    Work is done in float32 over blocks of output columns and chunks of rows,
+    so peak memory is a few (chunk_rows x columns) arrays plus the result. Each
+    pair uses only the rows where both columns are present, as pandas does;
+    Spearman ranks each column once over its own non-missing values.
+    Returns (R as float32 ndarray, pairwise counts, column names).
+    """
+    numeric = df.select_dtypes(include=np.number)
+    if method == "spearman":
+        numeric = numeric.rank(method="average")
+    columns = list(numeric.columns)
+    X = numeric.to_numpy(dtype=np.float32, na_value=np.nan)
+    # Centering first keeps float32 sums well conditioned
+    X = X - np.nanmean(X, axis=0)
+    has_missing = bool(np.isnan(X).any())
+    p = X.shape[1]
+    R = np.empty((p, p), dtype=np.float32)
+    counts = np.empty((p, p), dtype=np.int64)
+
+    for start in range(0, p, block_cols):
+        stop = min(start + block_cols, p)
+        width = stop - start
+        n = np.zeros((width, p))
+        sx, sy, sxx, syy, sxy = (np.zeros((width, p)) for _ in range(5))
+        for row in range(0, len(X), chunk_rows):
+            chunk = X[row:row + chunk_rows]
+            mask = (~np.isnan(chunk)).astype(np.float32)
+            values = np.nan_to_num(chunk, nan=0.0)
+            a, ma = values[:, start:stop], mask[:, start:stop]
+            sxy += a.T @ values
+            if has_missing:
+                n += ma.T @ mask
+                sx += a.T @ mask
+                sy += ma.T @ values
+                sxx += (a * a).T @ mask
+                syy += ma.T @ (values * values)
+            else:
+                n += len(chunk)
+                sxx += (a * a).sum(axis=0)[:, None]
+                syy += (values * values).sum(axis=0)[None, :]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = n * sxy - sx * sy
+            var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+            block = cov / np.sqrt(var)
+        block[(n < 3) | ~(var > 0)] = np.nan
+        R[start:stop] = np.clip(block, -1, 1)
+        counts[start:stop] = n.astype(np.int64)
+    return R, counts, columns
+
+
+def top_pairs(R, columns, k=50, counts=None):
+    """The k most strongly correlated distinct pairs, by absolute correlation"""
+    i, j = np.triu_indices(len(columns), k=1)
+    strength = np.nan_to_num(np.abs(R[i, j]), nan=-1.0)
+    k = min(k, len(strength))
+    best = np.argpartition(-strength, k - 1)[:k] if k else np.array([], dtype=np.int64)
+    best = best[np.argsort(-strength[best])]
+    best = best[strength[best] >= 0]
+    names = np.asarray(columns, dtype=object)
+    pairs = pd.DataFrame({"column_a": names[i[best]], "column_b": names[j[best]], "r": R[i[best], j[best]]})
+    if counts is not None:
+        pairs["n"] = counts[i[best], j[best]]
+    return pairs
+
+
+def correlation_blocks(R, columns, threshold=0.5):
+    """Group columns into blocks whose members correlate at least about |r| >= threshold.
+
+    Average-linkage clustering on 1 - |r|. Returns (block label per column,
+    leaf order placing correlated columns next to each other).
+    """
+    if len(columns) < 2:
+        return np.ones(len(columns), dtype=int), np.arange(len(columns))
+    distance = 1 - np.abs(np.nan_to_num(R.astype(np.float64), nan=0.0))
+    np.fill_diagonal(distance, 0)
+    tree = linkage(squareform(np.clip(distance, 0, None), checks=False), method="average")
+    return fcluster(tree, t=1 - threshold, criterion="distance"), leaves_list(tree)
+
+
+def block_summary(R, columns, labels):
+    """Multi-column blocks with their size, members and mean within-block |r|"""
+    rows = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        if len(members) < 2:
+            continue
+        sub = np.abs(R[np.ix_(members, members)])
+        within = np.nanmean(sub[np.triu_indices(len(members), k=1)])
+        rows.append({"block": int(label), "columns": len(members), "mean_abs_r": round(float(within), 3),
+                     "members": ", ".join(str(columns[m]) for m in members)})
+    summary = pd.DataFrame(rows, columns=["block", "columns", "mean_abs_r", "members"])
+    return summary.sort_values(["columns", "mean_abs_r"], ascending=False).reset_index(drop=True)
+
+
+def reduced_matrix(R, columns, pairs, order, max_columns=40):
+    """Correlation sub-matrix of the columns in the strongest pairs, in cluster order.
+
+    Only this matrix is drawn, however wide the data is.
+    """
+    keep = []
+    for a, b in zip(pairs["column_a"], pairs["column_b"]):
+        keep.extend(c for c in (a, b) if c not in keep)
+    keep = set(keep[:max_columns])
+    position = {c: i for i, c in enumerate(columns)}
+    ordered = [columns[i] for i in order if columns[i] in keep]
+    index = [position[c] for c in ordered]
+    return pd.DataFrame(R[np.ix_(index, index)], index=ordered, columns=ordered)
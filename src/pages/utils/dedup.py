@@ -0,0 +1,140 @@
+import re
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from utils.sentiment import NEGATIONS
+
+_NON_WORD = re.compile(r"[^\w]+")
+_CONTRACTION = re.compile(r"n['’‘]t\b")
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and collapse whitespace ("Good!!" -> "good", "Don't" -> "dont")"""
+    return _NON_WORD.sub(" ", _CONTRACTION.sub("nt", str(text).lower())).strip()
+
+
+def negation_keys(texts):
+    """Integer id of the set of negation words in each normalized text.
+
+    Texts with different ids say opposite things however similar they look
+    ("satisfied" vs "not satisfied"), so they must never be merged.
+    """
+    return pd.factorize(pd.Series([
+        " ".join(sorted(NEGATIONS.intersection(t.split()))) for t in texts
+    ], dtype=object))[0]
+
+
+def _shingle_hashes(texts, k):
+    """Vectorized k-character shingle hashes over all texts at once.
+
+    Returns (hashes, starts): hashes of every shingle, grouped by text, and the
+    offset of each text's first shingle. Texts shorter than k are padded so that
+    every text has at least one shingle.
+    """
+    encoded = [t.ljust(k).encode("utf-8") for t in texts]
+    lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    ends = np.cumsum(lengths)
+    n_shingles = lengths - k + 1
+    # Start position of every shingle in the joined buffer, skipping those that cross texts
+    starts = np.repeat(ends - lengths, n_shingles) + (
+        np.arange(n_shingles.sum()) - np.repeat(np.cumsum(n_shingles) - n_shingles, n_shingles)
+    )
+    hashes = np.zeros(len(starts), dtype=np.uint64)
+    for offset in range(k):
+        hashes = hashes * np.uint64(0x100000001B3) ^ data[starts + offset]
+    return hashes, np.concatenate([[0], np.cumsum(n_shingles)[:-1]])
+
+
+def minhash_signatures(texts, num_perm=64, k=3, seed=1, chunk_shingles=4_000_000):
+    """MinHash signatures (len(texts) x num_perm uint32) of character k-shingles.
+
+    Permutations are multiply-shift hashes applied one at a time to bounded
+    chunks of shingles, so memory stays flat for millions of texts.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    step = max(1, chunk_shingles // max(1, sum(len(t) for t in texts[:1000]) // max(1, len(texts[:1000]))))
+    for lo in range(0, len(texts), step):
+        hashes, starts = _shingle_hashes(texts[lo:lo + step], k)
+        for p in range(num_perm):
+            permuted = ((hashes * a[p] + b[p]) >> np.uint64(32)) & _MASK32
+            signatures[lo:lo + step, p] = np.minimum.reduceat(permuted, starts)
+    return signatures
+
+
+def _band_layout(num_perm, threshold):
+    """(bands, rows) whose LSH S-curve threshold (1/b)^(1/r) is closest to threshold"""
+    options = [(num_perm // r, r) for r in range(1, num_perm + 1) if num_perm % r == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+def lsh_groups(signatures, threshold=0.8, blocks=None):
+    """Group ids joining texts whose estimated Jaccard similarity reaches threshold.
+
+    Each band of the signature is hashed to a bucket; members of a bucket are
+    linked to its first member when their signatures agree on at least
+    threshold of the permutations, and linked texts are merged with connected
+    components. Work is linear in the number of texts per band. Texts with
+    different ids in blocks (e.g. negation_keys) are never linked, so no group
+    spans two blocks.
+    """
+    n, num_perm = signatures.shape
+    bands, rows = _band_layout(num_perm, threshold)
+    mix = np.random.default_rng(0).integers(1, 2**63, size=rows, dtype=np.uint64) | np.uint64(1)
+    src, dst = [], []
+    for band in range(bands):
+        block = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys = (block * mix).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        first = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        leader = order[np.flatnonzero(first)[np.cumsum(first) - 1]]
+        candidate = order != leader
+        src.append(order[candidate])
+        dst.append(leader[candidate])
+    src, dst = np.concatenate(src), np.concatenate(dst)
+    if len(src):
+        # Drop bucket collisions that are not actually similar
+        agree = np.empty(len(src), dtype=np.float32)
+        for lo in range(0, len(src), 1_000_000):
+            agree[lo:lo + 1_000_000] = (
+                signatures[src[lo:lo + 1_000_000]] == signatures[dst[lo:lo + 1_000_000]]
+            ).mean(axis=1)
+        keep = agree >= threshold
+        if blocks is not None:
+            keep &= blocks[src] == blocks[dst]
+        src, dst = src[keep], dst[keep]
+    graph = sparse.coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n, n))
+    return connected_components(graph, directed=False)[1]
+
+
+def dedupe_texts(texts, threshold=0.8, num_perm=64, k=3):
+    """Collapse exact and near-duplicate texts into weighted representatives.
+
+    Texts are normalized first, so case/punctuation variants collapse exactly
+    and cheaply; MinHash LSH then groups the remaining distinct texts whose
+    character-shingle Jaccard similarity is at least threshold and that share
+    the same negation words.
+    Returns (representatives, weights, labels): one text per group (its most
+    common original wording), the number of responses in each group, and the
+    group index of every input text.
+    """
+    texts = pd.Series(list(texts), dtype=object).astype(str)
+    if texts.empty:
+        return [], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    exact, uniques = pd.factorize(texts.map(normalize_text))
+    if len(uniques) > 1 and threshold < 1:
+        near = lsh_groups(minhash_signatures(list(uniques), num_perm, k), threshold, negation_keys(uniques))
+        labels = pd.factorize(near[exact])[0]
+    else:
+        labels = exact
+    weights = np.bincount(labels)
+    # Representative: the most frequent original wording in each group
+    wording = pd.DataFrame({"group": labels, "text": texts}).value_counts(sort=True)
+    representatives = wording.reset_index().drop_duplicates("group").set_index("group")["text"]
+    return representatives.sort_index().tolist(), weights, labels
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+
+def _quantile_sorted(values, n, q):
+    """Linear-interpolated quantile q of the first n entries of each sorted row"""
+    position = np.maximum(n - 1, 0) * q
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, np.maximum(n - 1, 0))
+    rows = np.arange(len(values))
+    frac = position - low
+    return values[rows, low] * (1 - frac) + values[rows, high] * frac
+
+
+def sorted_columns(numeric):
+    """Each column of a numeric frame as a sorted row (NaNs last), plus non-missing counts.
+
+    Rows are contiguous so the sort runs along memory.
+    """
+    # Always a copy: a single float column can come back as a read-only view of the frame
+    values = np.array(numeric.to_numpy(dtype=np.float64, na_value=np.nan).T, order="C")
+    values.sort(axis=1)
+    return values, (~np.isnan(values)).sum(axis=1)
+
+
+def distribution_summaries(df, columns=None, bins=30, presorted=None):
+    """Histogram counts and box-plot statistics for many numeric columns at once.
+
+    All columns are sorted in one pass (NaNs sort last); ranges, quartiles,
+    whiskers, outlier counts and histogram counts are then read off the sorted
+    values with index arithmetic and searchsorted, so only these aggregates
+    need to reach the browser. presorted takes the (values, n) from
+    sorted_columns when the caller has already sorted. Returns a dict with
+    columns, edges and counts (columns x bins) and a box DataFrame (count,
+    min, q1, median, q3, max, whisker_low, whisker_high, outliers) indexed by
+    column.
+    """
+    numeric = df[columns] if columns is not None else df.select_dtypes(include=np.number)
+    values, n = presorted if presorted is not None else sorted_columns(numeric)
+    n_cols = len(values)
+    empty = n == 0
+    if values.shape[1] == 0:
+        values = np.full((n_cols, 1), np.nan)
+
+    rows = np.arange(n_cols)
+    lo = np.where(empty, np.nan, values[:, 0])
+    hi = np.where(empty, np.nan, values[rows, np.maximum(n - 1, 0)])
+    q1, median, q3 = (np.where(empty, np.nan, _quantile_sorted(values, n, q)) for q in (0.25, 0.5, 0.75))
+    fence_low, fence_high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+
+    span = np.where(hi > lo, hi - lo, 1.0)
+    start = np.nan_to_num(lo, nan=0.0)
+    span = np.nan_to_num(span, nan=1.0)
+    edges = start[:, None] + span[:, None] * np.linspace(0, 1, bins + 1)[None, :]
+    counts = np.zeros((n_cols, bins), dtype=np.int64)
+    whisker_low, whisker_high = np.full(n_cols, np.nan), np.full(n_cols, np.nan)
+    outliers = np.zeros(n_cols, dtype=np.int64)
+    for j in np.flatnonzero(~empty):
+        column = values[j, :n[j]]
+        # Interior edges take values equal to the edge into the upper bin; the last bin is closed
+        cuts = np.searchsorted(column, edges[j, 1:-1], side="left")
+        counts[j] = np.diff(np.r_[0, cuts, n[j]])
+        first = np.searchsorted(column, fence_low[j], side="left")
+        last = np.searchsorted(column, fence_high[j], side="right") - 1
+        whisker_low[j], whisker_high[j] = column[first], column[last]
+        outliers[j] = first + (n[j] - 1 - last)
+
+    box = pd.DataFrame({
+        "count": n, "min": lo, "q1": q1, "median": median, "q3": q3, "max": hi,
+        "whisker_low": whisker_low, "whisker_high": whisker_high, "outliers": outliers,
+    }, index=numeric.columns)
+    return {"columns": list(numeric.columns), "edges": edges, "counts": counts, "box": box}
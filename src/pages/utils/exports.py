@@ -0,0 +1,69 @@
+import os
+import re
+import tempfile
+import xlsxwriter
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _sheet_name(index, title, used):
+    """Excel-safe, unique sheet name (max 31 chars, no []:*?/\\)"""
+    base = re.sub(r"[\[\]:*?/\\]", " ", f"T{index + 1} {title}").strip()[:31]
+    name, n = base, 1
+    while name.lower() in used:
+        suffix = f" ({n})"
+        name = base[:31 - len(suffix)] + suffix
+        n += 1
+    used.add(name.lower())
+    return name
+
+
+def _write_frame(ws, row, frame, header_fmt):
+    ws.write_row(row, 0, [str(c) for c in frame.columns], header_fmt)
+    for values in frame.itertuples(index=False):
+        row += 1
+        ws.write_row(row, 0, ["" if v is None else v for v in values])
+    return row + 1
+
+
+def write_tables_xlsx(tables, layout="sheets"):
+    """Write (title, DataFrame) pairs to one .xlsx and return its bytes.
+
+    layout="sheets" puts each table on its own sheet; "stacked" writes them one
+    below another on a single sheet. Uses xlsxwriter's constant_memory mode, which
+    flushes each row to disk as it goes, so memory stays flat with table count.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "export.xlsx")
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "tmpdir": tmp, "nan_inf_to_errors": True})
+        title_fmt = workbook.add_format({"bold": True, "font_size": 12})
+        header_fmt = workbook.add_format({"bold": True, "bottom": 1})
+        if layout == "stacked":
+            ws = workbook.add_worksheet("All Tables")
+            ws.set_column(0, 0, 40)
+            row = 0
+            for i, (title, frame) in enumerate(tables):
+                ws.write(row, 0, f"Table {i + 1}: {title}", title_fmt)
+                row = _write_frame(ws, row + 1, frame, header_fmt) + 1
+        else:
+            used = set()
+            for i, (title, frame) in enumerate(tables):
+                ws = workbook.add_worksheet(_sheet_name(i, title, used))
+                ws.set_column(0, 0, 40)
+                ws.write(0, 0, title, title_fmt)
+                _write_frame(ws, 2, frame, header_fmt)
+        workbook.close()
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def write_table_xlsx(frame, sheet_name="Formatted Table"):
+    """Single-table workbook with a header row, matching the per-table download"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "table.xlsx")
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "tmpdir": tmp, "nan_inf_to_errors": True})
+        header_fmt = workbook.add_format({"bold": True, "bottom": 1})
+        _write_frame(workbook.add_worksheet(sheet_name), 0, frame, header_fmt)
+        workbook.close()
+        with open(path, "rb") as f:
+            return f.read()
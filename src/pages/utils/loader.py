@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+
+def _csv_chunks_arrow(source):
+    """CSV record batches from pyarrow's multithreaded streaming reader"""
+    from pyarrow import csv as pa_csv
+    if hasattr(source, "seek"):
+        source.seek(0)
+    # Blank cells become missing, as with pandas
+    options = pa_csv.ConvertOptions(strings_can_be_null=True)
+    for batch in pa_csv.open_csv(source, convert_options=options):
+        yield batch.to_pandas()
+
+
+def _csv_chunks_pandas(source, chunksize):
+    if hasattr(source, "seek"):
+        source.seek(0)
+    yield from pd.read_csv(source, chunksize=chunksize, low_memory=False)
+
+
+def _excel_chunks(source, chunksize, sheet_name=0):
+    """XLSX rows in DataFrame chunks via openpyxl's read-only streaming mode"""
+    from openpyxl import load_workbook
+    if hasattr(source, "seek"):
+        source.seek(0)
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        # Same column naming as read_excel: blanks become "Unnamed: i", duplicates get ".1"
+        names, seen = [], {}
+        for i, h in enumerate(header):
+            name = str(h) if h is not None else f"Unnamed: {i}"
+            seen[name] = seen.get(name, -1) + 1
+            names.append(f"{name}.{seen[name]}" if seen[name] else name)
+        width = len(names)
+        batch, emitted = [], False
+        for row in rows:
+            batch.append(tuple(row[:width]) + (None,) * (width - len(row)))
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=names)
+                batch, emitted = [], True
+        # An empty trailing chunk would be all-object; only a header-only sheet needs one
+        if batch or not emitted:
+            yield pd.DataFrame(batch, columns=names)
+    finally:
+        workbook.close()
+
+
+def _slim(chunk, category_ratio, downcast):
+    """Downcast numerics and turn repetitive strings into categoricals, column by column"""
+    for col in chunk.columns:
+        series = chunk[col]
+        if pd.api.types.is_bool_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        textual = pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+        if textual and len(series) and series.isna().all():
+            # All blank in this chunk: float NaN, as read_excel gives, so it concatenates with numbers
+            chunk[col] = series = series.astype(np.float64)
+        if pd.api.types.is_integer_dtype(series) and downcast:
+            chunk[col] = pd.to_numeric(series, downcast="unsigned" if series.min() >= 0 else "integer")
+        elif pd.api.types.is_float_dtype(series) and downcast:
+            lean = series.astype(np.float32)
+            # Only when lossless (e.g. ratings or 1/0 flags stored as float because of blanks)
+            if np.array_equal(lean.to_numpy(dtype=np.float64), series.to_numpy(dtype=np.float64), equal_nan=True):
+                chunk[col] = lean
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            if series.nunique(dropna=True) <= category_ratio * max(len(series), 1):
+                chunk[col] = series.astype("category")
+    return chunk
+
+
+def _combine(chunks, category_ratio):
+    """Concatenate slimmed chunks, keeping categoricals categorical across chunks"""
+    if len(chunks) == 1:
+        frame = chunks[0]
+    else:
+        for col in chunks[0].columns:
+            # Chunks where the column is all blank follow the dtype of the others
+            dtypes = [chunk[col].dtype for chunk in chunks if chunk[col].notna().any()]
+            if dtypes and all(isinstance(d, pd.CategoricalDtype) for d in dtypes):
+                categories = dtypes[0].categories
+                for d in dtypes[1:]:
+                    categories = categories.union(d.categories)
+                for chunk in chunks:
+                    chunk[col] = chunk[col].astype(pd.CategoricalDtype(categories))
+            elif any(isinstance(d, pd.CategoricalDtype) for d in dtypes):
+                for chunk in chunks:
+                    if isinstance(chunk[col].dtype, pd.CategoricalDtype):
+                        chunk[col] = chunk[col].astype(object)
+            elif dtypes and all(d == dtypes[0] for d in dtypes) and not pd.api.types.is_integer_dtype(dtypes[0]):
+                for chunk in chunks:
+                    if chunk[col].dtype != dtypes[0]:
+                        chunk[col] = chunk[col].astype(dtypes[0])
+        frame = pd.concat(chunks, ignore_index=True)
+    for col in frame.columns:
+        series = frame[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Categories that turned out high-cardinality over the whole file go back to strings
+            if len(series.cat.categories) > category_ratio * max(len(series), 1):
+                frame[col] = series.astype(object)
+            else:
+                frame[col] = series.cat.remove_unused_categories()
+    return frame
+
+
+def _consume(raw_chunks, category_ratio, downcast):
+    """Slim each chunk as it arrives, tallying the memory it had as parsed"""
+    chunks, before, dtypes_before = [], None, None
+    for chunk in raw_chunks:
+        usage = chunk.memory_usage(deep=True, index=False)
+        before = usage if before is None else before.add(usage, fill_value=0)
+        if dtypes_before is None:
+            dtypes_before = chunk.dtypes.astype(str)
+        chunks.append(_slim(chunk, category_ratio, downcast))
+    return chunks, before, dtypes_before
+
+
+def load_table(source, sheet_name=0, chunksize=200_000, category_ratio=0.5, downcast=True):
+    """Read a CSV/XLSX upload (or path) into a memory-lean DataFrame.
+
+    The file is read in chunks and each chunk is slimmed before the next one is
+    read: integers are downcast (1/0 flags become uint8), floats become float32
+    when that is lossless, and string columns whose distinct values are at most
+    category_ratio of the rows become categoricals. Pass downcast=False to keep
+    numeric dtypes for code that does arithmetic in the data's own dtype.
+    Returns (df, report) where report has per-column dtype and MB before
+    (as pandas parses it by default) and after.
+    """
+    # Only Excel extensions read as Excel; anything else is parsed as CSV, as the pages always did
+    name = str(getattr(source, "name", source)).lower()
+    if name.endswith(".xlsx"):
+        chunks, before, dtypes_before = _consume(
+            _excel_chunks(source, chunksize, sheet_name), category_ratio, downcast
+        )
+    elif name.endswith(".xls"):
+        # Legacy workbooks cannot be streamed by openpyxl; read whole, then slim
+        chunks, before, dtypes_before = _consume(
+            [pd.read_excel(source, sheet_name=sheet_name)], category_ratio, downcast
+        )
+    else:
+        try:
+            import pyarrow  # noqa: F401  (optional fast engine)
+            chunks, before, dtypes_before = _consume(_csv_chunks_arrow(source), category_ratio, downcast)
+        except Exception:
+            # Not installed, or a later block contradicts the types inferred from the first
+            chunks, before, dtypes_before = _consume(
+                _csv_chunks_pandas(source, chunksize), category_ratio, downcast
+            )
+    if not chunks:
+        return pd.DataFrame(), pd.DataFrame(columns=["dtype_before", "dtype_after", "mb_before", "mb_after"])
+    df = _combine(chunks, category_ratio)
+
+    report = pd.DataFrame({
+        "dtype_before": dtypes_before,
+        "dtype_after": df.dtypes.astype(str),
+        "mb_before": before / 2**20,
+        "mb_after": df.memory_usage(deep=True, index=False) / 2**20,
+    }).round(2)
+    return df, report
+
+
+def memory_caption(report):
+    """One-line summary of a load_table memory report"""
+    before, after = report["mb_before"].sum(), report["mb_after"].sum()
+    saved = 100 * (1 - after / before) if before else 0.0
+    return f"Memory: {before:,.1f} MB → {after:,.1f} MB ({saved:.0f}% less)"
@@ -1,4 +1,200 @@
+import json
+import os
+import shutil
+import string
+from io import BytesIO
+import numpy as np
 import pandas as pd
+from utils import cache
+from utils.loader import load_table
+
+# WinCross banner layout, relative to each "Table Title" anchor row
+TITLE_COL = 1
+LABEL_COL = 2
+FIRST_SEGMENT_COL = 3
+TITLE_OFFSET = 1
+BASE_OFFSET = 6
+BODY_OFFSET = 8
+
 
 def parse_crosstab_file(uploaded_file):
-    return pd.read_excel(uploaded_file)
+    return load_table(uploaded_file)[0]
+
+
+def _segment_names(raw, anchor, width):
+    """Banner labels from the header rows between title and base, else WinCross letters"""
+    header = raw[anchor + TITLE_OFFSET + 1:anchor + BASE_OFFSET, FIRST_SEGMENT_COL:FIRST_SEGMENT_COL + width]
+    for cells in header[::-1]:
+        if all(isinstance(c, str) and c.strip() for c in cells):
+            return [c.strip() for c in cells]
+    letters = string.ascii_uppercase
+    return [f"Group {letters[i % 26] * (i // 26 + 1)}" for i in range(width)]
+
+
+def parse_banner_tables(df):
+    """Parse every table of a WinCross-style banner sheet read with header=None.
+
+    Anchors are found in one scan of the title column and each table body is
+    sliced as freq / percent / sig row triplets across the full banner width,
+    which is detected from the base row. Returns a list of dicts with keys
+    title, segments, bases, metrics, freq, pct (float arrays, NaN for blanks
+    and '-') and sig (object array of significance letters).
+    """
+    raw = df.to_numpy(dtype=object)
+    n_rows, n_cols = raw.shape
+    if n_rows == 0 or n_cols <= FIRST_SEGMENT_COL:
+        return []
+
+    numeric = df.iloc[:, FIRST_SEGMENT_COL:].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    is_label = np.fromiter((isinstance(v, str) for v in raw[:, LABEL_COL]), dtype=bool, count=n_rows)
+    anchors = np.flatnonzero(
+        df.iloc[:, TITLE_COL].astype(str).str.contains("Table Title", regex=False).to_numpy()
+    )
+    anchors = anchors[(anchors >= 1) & (anchors + BASE_OFFSET < n_rows)]
+
+    tables = []
+    next_free = 0
+    for anchor in anchors:
+        if anchor < next_free:
+            continue
+        base_row = numeric[anchor + BASE_OFFSET]
+        missing = np.flatnonzero(np.isnan(base_row))
+        width = int(missing[0]) if len(missing) else len(base_row)
+
+        start = anchor + BODY_OFFSET
+        # Metric rows repeat every 3 rows while the label column holds text
+        # and the whole freq/percent/sig triplet fits in the sheet
+        candidates = np.arange(start, n_rows - 2, 3)
+        breaks = np.flatnonzero(~is_label[candidates])
+        n_metrics = int(breaks[0]) if len(breaks) else len(candidates)
+        stop = start + 3 * n_metrics
+
+        block = numeric[start:stop, :width].reshape(n_metrics, 3, width)
+        sig = raw[start:stop, FIRST_SEGMENT_COL:FIRST_SEGMENT_COL + width].reshape(n_metrics, 3, width)[:, 2]
+        sig = np.where([[isinstance(s, str) for s in r] for r in sig], sig, "") if n_metrics else sig
+
+        tables.append({
+            "title": str(raw[anchor + TITLE_OFFSET, TITLE_COL]),
+            "segments": _segment_names(raw, anchor, width),
+            "bases": base_row[:width].copy(),
+            "metrics": [str(m) for m in raw[start:stop:3, LABEL_COL]],
+            "freq": block[:, 0].copy(),
+            "pct": block[:, 1].copy(),
+            "sig": sig.astype(object),
+        })
+        next_free = max(stop, anchor + 1)
+    return tables
+
+
+def format_banner_table(table):
+    """Display frame for a parsed table: 'pct% (freq)' cells per segment plus combined Sig"""
+    labels = [
+        f"{name} (n={int(base)})" if pd.notnull(base) else f"{name} (n=NA)"
+        for name, base in zip(table["segments"], table["bases"])
+    ]
+    freq, pct = table["freq"], table["pct"]
+    cells = np.where(
+        np.isnan(pct) | np.isnan(freq),
+        "",
+        np.char.add(
+            np.char.add(np.char.mod("%.1f%% (", np.nan_to_num(pct) * 100), np.char.mod("%d", np.nan_to_num(freq))),
+            ")"
+        ),
+    )
+    out = pd.DataFrame(cells, columns=labels)
+    out.insert(0, "Metric", table["metrics"])
+    out["Sig"] = [", ".join(s for s in row if s) for row in table["sig"]]
+    return out
+
+
+# Bump whenever parse_banner_tables output changes so stale cache entries are ignored
+PARSER_VERSION = "1"
+_CACHE_NAMESPACE = "crosstabs"
+
+
+def excel_sheet_names(data):
+    """Sheet names of an uploaded workbook (bytes), cached by content hash"""
+    path = cache.entry_path(_CACHE_NAMESPACE, cache.content_key(data, "sheets") + ".json")
+    if os.path.exists(path):
+        cache.touch(path)
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    names = pd.ExcelFile(BytesIO(data)).sheet_names
+    tmp = path + f".{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(names, f)
+    os.replace(tmp, path)
+    return names
+
+
+def _save_tables(tables, path):
+    staged = cache.staging_dir(_CACHE_NAMESPACE)
+    meta = []
+    offset = base_offset = 0
+    for t in tables:
+        n_metrics, width = t["freq"].shape
+        meta.append({
+            "title": t["title"],
+            "segments": t["segments"],
+            "metrics": t["metrics"],
+            "sig": t["sig"].tolist(),
+            "offset": offset,
+            "base_offset": base_offset,
+            "n_metrics": n_metrics,
+            "width": width,
+        })
+        offset += n_metrics * width
+        base_offset += width
+    flat = lambda key: np.concatenate([t[key].ravel() for t in tables]) if tables else np.empty(0)
+    np.save(os.path.join(staged, "freq.npy"), flat("freq"))
+    np.save(os.path.join(staged, "pct.npy"), flat("pct"))
+    np.save(os.path.join(staged, "bases.npy"), flat("bases"))
+    with open(os.path.join(staged, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    cache.commit_dir(staged, path)
+
+
+def _load_tables(path):
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    freq = np.load(os.path.join(path, "freq.npy"), mmap_mode="r")
+    pct = np.load(os.path.join(path, "pct.npy"), mmap_mode="r")
+    bases = np.load(os.path.join(path, "bases.npy"), mmap_mode="r")
+    tables = []
+    for m in meta:
+        size = m["n_metrics"] * m["width"]
+        shape = (m["n_metrics"], m["width"])
+        sig = np.empty(shape, dtype=object)
+        if size:
+            sig[:] = m["sig"]
+        tables.append({
+            "title": m["title"],
+            "segments": m["segments"],
+            "bases": bases[m["base_offset"]:m["base_offset"] + m["width"]],
+            "metrics": m["metrics"],
+            "freq": freq[m["offset"]:m["offset"] + size].reshape(shape),
+            "pct": pct[m["offset"]:m["offset"] + size].reshape(shape),
+            "sig": sig,
+        })
+    return tables
+
+
+def load_banner_tables(data, sheet_name):
+    """Parsed banner tables for an uploaded workbook (bytes), via the on-disk cache.
+
+    Entries are keyed by the workbook content hash, sheet name and PARSER_VERSION
+    and stored as memory-mapped .npy columns, so reruns skip Excel entirely.
+    """
+    path = cache.entry_path(_CACHE_NAMESPACE, cache.content_key(data, sheet_name, PARSER_VERSION))
+    if os.path.isdir(path):
+        try:
+            tables = _load_tables(path)
+            cache.touch(path)
+            return tables
+        except (OSError, ValueError, KeyError):
+            shutil.rmtree(path, ignore_errors=True)
+    df = pd.read_excel(BytesIO(data), sheet_name=sheet_name, header=None)
+    tables = parse_banner_tables(df)
+    _save_tables(tables, path)
+    cache.evict_lru(_CACHE_NAMESPACE)
+    return tables
@@ -0,0 +1,326 @@
+import csv
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.decomposition import MiniBatchNMF, NMF
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+from sklearn.preprocessing import normalize
+from utils import cache
+
+
+def iter_text_chunks(source, text_col, chunksize=50_000):
+    """Yield (row_numbers, texts) chunks of a CSV/XLSX text column without loading the file.
+
+    source is a path or an uploaded file object (rewound on every call, so the
+    column can be streamed several times). Row numbers are 0-based data rows of
+    the file; blank responses are skipped.
+    """
+    # Same extension rule as loader.load_table: only .xlsx/.xls are Excel
+    name = str(getattr(source, "name", source)).lower()
+    if hasattr(source, "seek"):
+        source.seek(0)
+    if name.endswith(".xls"):
+        if text_col not in pd.read_excel(source, nrows=0).columns:
+            raise KeyError(text_col)
+        if hasattr(source, "seek"):
+            source.seek(0)
+        texts = pd.read_excel(source, usecols=[text_col], dtype={text_col: str})[text_col]
+        keep = (texts.notna() & (texts.str.strip() != "")).to_numpy()
+        numbers, texts = np.flatnonzero(keep), texts[keep].tolist()
+        for start in range(0, len(texts), chunksize):
+            yield numbers[start:start + chunksize], texts[start:start + chunksize]
+        return
+    if not name.endswith(".xlsx"):
+        if text_col not in pd.read_csv(source, nrows=0).columns:
+            raise KeyError(text_col)
+        if hasattr(source, "seek"):
+            source.seek(0)
+        offset = 0
+        for chunk in pd.read_csv(source, usecols=[text_col], chunksize=chunksize, dtype={text_col: str}):
+            texts = chunk[text_col]
+            keep = texts.notna().to_numpy()
+            yield np.arange(offset, offset + len(chunk))[keep], texts[keep].astype(str).tolist()
+            offset += len(chunk)
+        return
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        if text_col not in header:
+            raise KeyError(text_col)
+        col = list(header).index(text_col)
+        numbers, texts = [], []
+        for i, row in enumerate(rows):
+            value = row[col] if col < len(row) else None
+            if value is not None and str(value).strip():
+                numbers.append(i)
+                texts.append(str(value))
+            if len(texts) >= chunksize:
+                yield np.array(numbers), texts
+                numbers, texts = [], []
+        if texts:
+            yield np.array(numbers), texts
+    finally:
+        workbook.close()
+
+
+def build_vocabulary(chunks, max_features=2000, min_df=2, buffer_factor=20):
+    """Streaming document-frequency vocabulary with bounded memory.
+
+    Term counts are kept for at most max_features * buffer_factor terms; when the
+    buffer overflows the rarer half is dropped (heavy-hitter pruning), so memory
+    stays flat however many responses are read. Returns (terms, doc_freq, n_docs).
+    """
+    analyzer = CountVectorizer(stop_words="english").build_analyzer()
+    doc_freq = Counter()
+    limit = max_features * buffer_factor
+    n_docs = 0
+    for _, texts in chunks:
+        for text in texts:
+            doc_freq.update(set(analyzer(text)))
+        n_docs += len(texts)
+        if len(doc_freq) > limit:
+            doc_freq = Counter(dict(doc_freq.most_common(limit // 2)))
+    top = [(t, c) for t, c in doc_freq.most_common(max_features) if c >= min_df]
+    return [t for t, _ in top], np.array([c for _, c in top], dtype=np.float64), n_docs
+
+
+class StreamingTfidf:
+    """TF-IDF over a fixed vocabulary with IDF from streamed document frequencies"""
+
+    def __init__(self, terms, doc_freq, n_docs):
+        self.terms = np.array(terms)
+        self.counter = CountVectorizer(stop_words="english", vocabulary=terms)
+        # Same smoothed IDF as sklearn's TfidfTransformer
+        self.idf = np.log((1 + n_docs) / (1 + doc_freq)) + 1
+
+    def counts(self, texts):
+        return self.counter.transform(texts)
+
+    def transform(self, texts=None, counts=None):
+        counts = self.counts(texts) if counts is None else counts
+        return normalize(counts.multiply(self.idf).tocsr())
+
+
+def stream_topics(chunk_factory, out_path, n_topics=5, max_features=2000, n_epochs=2,
+                  batch_size=2048, random_state=42, on_progress=None):
+    """Out-of-core TF-IDF + mini-batch NMF over a streamed text column.
+
+    chunk_factory() must return a fresh iterator of (row_numbers, texts) chunks
+    (see iter_text_chunks); the column is streamed 2 + n_epochs times. Dominant
+    topic and its weight for every response are appended to a CSV at out_path.
+    Returns a dict with top_terms per topic, topic_sizes, n_docs and the
+    vectorizer / model for reuse.
+    """
+    step = lambda stage: on_progress(stage) if on_progress else None
+    step("Building vocabulary")
+    terms, doc_freq, n_docs = build_vocabulary(chunk_factory(), max_features)
+    if len(terms) < n_topics:
+        raise ValueError("Not enough distinct terms to fit the requested number of topics.")
+    tfidf = StreamingTfidf(terms, doc_freq, n_docs)
+    model = MiniBatchNMF(n_components=n_topics, batch_size=batch_size, random_state=random_state)
+
+    for epoch in range(n_epochs):
+        step(f"Fitting topics (pass {epoch + 1}/{n_epochs})")
+        for _, texts in chunk_factory():
+            X = tfidf.transform(texts)
+            for start in range(0, X.shape[0], batch_size):
+                batch = X[start:start + batch_size]
+                if batch.shape[0] >= n_topics:
+                    model.partial_fit(batch)
+
+    step("Assigning topics")
+    sizes = np.zeros(n_topics, dtype=np.int64)
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["row", "topic", "topic_weight"])
+        for rows, texts in chunk_factory():
+            W = model.transform(tfidf.transform(texts))
+            topic = W.argmax(axis=1)
+            weight = W[np.arange(len(topic)), topic]
+            # Responses with no known terms get topic 0 (1-based) rather than a spurious assignment
+            assigned = np.where(weight > 0, topic + 1, 0)
+            sizes += np.bincount(topic[weight > 0], minlength=n_topics)
+            writer.writerows(zip(rows.tolist(), assigned.tolist(), np.round(weight, 4).tolist()))
+
+    top_terms = [tfidf.terms[np.argsort(component)[::-1][:10]].tolist() for component in model.components_]
+    return {"top_terms": top_terms, "topic_sizes": sizes, "n_docs": n_docs, "tfidf": tfidf, "model": model}
+
+
+# === TOPIC-COUNT SELECTION ===
+# Bump when the cached matrix or model format changes
+TOPICS_VERSION = "2"
+_CACHE_NAMESPACE = "topics"
+
+
+def corpus_key(texts, max_features, weights=None):
+    weights = b"" if weights is None else np.asarray(weights, dtype=np.int64).tobytes()
+    return cache.content_key("\n".join(texts), max_features, weights, TOPICS_VERSION)
+
+
+def _weighted_tfidf(counts, weights, max_features):
+    """Vocabulary, IDF and TF-IDF as if every row were repeated weights[i] times"""
+    totals = np.asarray(counts.T @ weights).ravel()
+    keep = np.sort(np.argsort(-totals, kind="stable")[:max_features])
+    counts = counts[:, keep]
+    doc_freq = np.asarray((counts > 0).T @ weights).ravel()
+    # Same smoothed IDF as TfidfTransformer on the expanded corpus
+    idf = np.log((1 + weights.sum()) / (1 + doc_freq)) + 1
+    return keep, counts, normalize(counts.multiply(idf).tocsr())
+
+
+def cached_dtm(texts, max_features=500, weights=None):
+    """TF-IDF document-term matrix for texts, built once per corpus and kept on disk.
+
+    The CSR arrays are saved as .npy files so worker processes can memory-map the
+    same matrix instead of receiving a pickled copy. The raw term counts are kept
+    alongside (load_counts) for word clouds and other frequency views.
+    weights gives each text's multiplicity (see dedup.dedupe_texts): vocabulary,
+    IDF and the topic fits then match the full, un-collapsed corpus.
+    Returns (path, X, terms).
+    """
+    path = cache.entry_path(_CACHE_NAMESPACE, corpus_key(texts, max_features, weights))
+    if not os.path.isdir(path):
+        if weights is None:
+            vectorizer = CountVectorizer(stop_words="english", max_features=max_features)
+            counts = vectorizer.fit_transform(texts).astype(np.int32).tocsr()
+            X = TfidfTransformer().fit_transform(counts).astype(np.float32).tocsr()
+            terms = vectorizer.get_feature_names_out()
+        else:
+            vectorizer = CountVectorizer(stop_words="english")
+            weights = np.asarray(weights, dtype=np.float64)
+            keep, counts, X = _weighted_tfidf(vectorizer.fit_transform(texts).tocsr(), weights, max_features)
+            counts, X = counts.astype(np.int32).tocsr(), X.astype(np.float32)
+            terms = vectorizer.get_feature_names_out()[keep]
+        staged = cache.staging_dir(_CACHE_NAMESPACE)
+        for prefix, matrix in (("", X), ("counts_", counts)):
+            for name in ("data", "indices", "indptr"):
+                np.save(os.path.join(staged, f"{prefix}{name}.npy"), getattr(matrix, name))
+        if weights is not None:
+            np.save(os.path.join(staged, "weights.npy"), weights)
+        with open(os.path.join(staged, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"shape": X.shape, "terms": terms.tolist()}, f)
+        cache.commit_dir(staged, path)
+        cache.evict_lru(_CACHE_NAMESPACE)
+    cache.touch(path)
+    X, terms = load_dtm(path)
+    return path, X, terms
+
+
+def load_dtm(path, prefix=""):
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    parts = [np.load(os.path.join(path, f"{prefix}{name}.npy"), mmap_mode="r") for name in ("data", "indices", "indptr")]
+    return sparse.csr_matrix(tuple(parts), shape=tuple(meta["shape"])), np.array(meta["terms"])
+
+
+def load_counts(path):
+    """Raw term-count matrix saved by cached_dtm, memory-mapped"""
+    return load_dtm(path, prefix="counts_")
+
+
+def load_weights(path):
+    """Row multiplicities saved by cached_dtm, or None for an unweighted corpus"""
+    weights_path = os.path.join(path, "weights.npy")
+    return np.load(weights_path) if os.path.exists(weights_path) else None
+
+
+def term_frequencies(counts, terms, rows=None, weights=None):
+    """{term: frequency} summed over all documents, a row subset, or weighted rows.
+
+    rows is a boolean mask or index array (e.g. one segment); weights is a
+    per-document weight vector (e.g. a topic's column of W).
+    """
+    if rows is not None:
+        counts = counts[rows]
+        weights = weights[rows] if weights is not None else None
+    totals = np.asarray(counts.sum(axis=0)).ravel() if weights is None else np.asarray(counts.T @ weights).ravel()
+    keep = totals > 0
+    return dict(zip(terms[keep].tolist(), totals[keep].astype(float).tolist()))
+
+
+def umass_coherence(H, X, top_n=10, weights=None):
+    """Mean UMass coherence of each topic's top terms, from document co-occurrence in X"""
+    present = (X > 0).astype(np.float32).tocsc()
+    weighted = present if weights is None else sparse.diags(weights.astype(np.float32)) @ present
+    scores = []
+    for component in H:
+        top = np.argsort(component)[::-1][:top_n]
+        co = (weighted[:, top].T @ present[:, top]).toarray()
+        doc_freq = np.diag(co)
+        pairs = [
+            np.log((co[i, j] + 1) / doc_freq[j])
+            for i in range(1, len(top)) for j in range(i) if doc_freq[j] > 0
+        ]
+        scores.append(float(np.mean(pairs)) if pairs else 0.0)
+    return np.array(scores)
+
+
+def _fit_topic_count(path, k, random_state=42):
+    """Fit NMF with k topics on the cached matrix at path; reuse a saved fit when present"""
+    model_path = os.path.join(path, f"nmf_k{k}.npz")
+    if os.path.exists(model_path):
+        saved = np.load(model_path)
+        return {key: saved[key] for key in saved.files}
+    X, _ = load_dtm(path)
+    weights = load_weights(path)
+    nmf = NMF(n_components=k, init="nndsvda", random_state=random_state, max_iter=400)
+    if weights is None:
+        W = nmf.fit_transform(X).astype(np.float32)
+    else:
+        # Weighted Frobenius loss: scaling row i by sqrt(w_i) is exact, then undo it on W
+        scale = np.sqrt(weights)
+        W = (nmf.fit_transform(sparse.diags(scale) @ X) / scale[:, None]).astype(np.float32)
+    H = nmf.components_.astype(np.float32)
+    fit = {
+        "W": W,
+        "H": H,
+        "reconstruction_error": np.float64(nmf.reconstruction_err_),
+        "coherence": umass_coherence(H, X, weights=weights),
+    }
+    tmp = f"{model_path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, **fit)
+    os.replace(tmp, model_path)
+    return fit
+
+
+def select_topic_count(path, ks, n_jobs=None):
+    """Fit every k in ks in parallel worker processes and recommend one.
+
+    Each fit is scored on mean UMass coherence (higher is better) and
+    reconstruction error. The recommendation is the most coherent k among those
+    whose error is within the elbow of the error curve. Fits are saved next to
+    the cached matrix, so asking for the same k again is instant.
+    Returns (fits keyed by k, scores DataFrame, recommended k).
+    """
+    ks = sorted(set(int(k) for k in ks))
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(ks))
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            fits = dict(zip(ks, pool.map(_fit_topic_count, [path] * len(ks), ks)))
+    else:
+        fits = {k: _fit_topic_count(path, k) for k in ks}
+    cache.touch(path)
+
+    scores = pd.DataFrame({
+        "k": ks,
+        "coherence": [float(fits[k]["coherence"].mean()) for k in ks],
+        "reconstruction_error": [float(fits[k]["reconstruction_error"]) for k in ks],
+    })
+    # Elbow: k values past which adding topics cuts error by less than average
+    errors = scores["reconstruction_error"].to_numpy()
+    gains = -np.diff(errors)
+    eligible = np.ones(len(ks), dtype=bool)
+    if len(gains) > 1 and gains.mean() > 0:
+        below = np.flatnonzero(gains < gains.mean())
+        if len(below):
+            eligible[below[0] + 2:] = False
+    recommended = int(scores["k"][eligible][scores["coherence"][eligible].idxmax()])
+    scores["recommended"] = scores["k"] == recommended
+    return fits, scores, recommended
@@ -0,0 +1,340 @@
+import heapq
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Bits set per byte value, used when np.bitwise_count is unavailable (numpy < 2)
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def popcount(packed):
+    """Count set bits along the last axis of a uint8 bit-packed array"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(packed).sum(axis=-1, dtype=np.int64)
+    return _POPCOUNT_TABLE[packed].sum(axis=-1, dtype=np.int64)
+
+
+def pack_reach(df, items):
+    """Pack each item's reach (value > 0, NaN = not reached) into a respondent bitset.
+
+    Returns a uint8 array of shape (len(items), ceil(n_respondents / 8)).
+    """
+    reached = df[list(items)].fillna(0).to_numpy() > 0
+    return np.packbits(reached.T, axis=1)
+
+
+class _TopK:
+    """Bounded min-heap that keeps the k highest-reach combinations"""
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+
+    def threshold(self):
+        return self.heap[0][0] if len(self.heap) >= self.k else -1
+
+    def push_many(self, counts, combos):
+        # Only candidates beating the current k-th best can enter the heap
+        candidates = np.flatnonzero(counts > self.threshold())
+        if len(candidates) > self.k:
+            part = np.argpartition(counts[candidates], -self.k)[-self.k:]
+            candidates = candidates[part]
+        for idx in candidates:
+            entry = (int(counts[idx]), combos(idx))
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, entry)
+            elif entry[0] > self.heap[0][0]:
+                heapq.heapreplace(self.heap, entry)
+
+    def ranked(self):
+        return sorted(self.heap, key=lambda e: (-e[0], e[1]))
+
+
+def turf_exact(packed, max_combo, top_k=10):
+    """Exhaustive TURF over bit-packed reach vectors.
+
+    Enumerates every combination of size 1..max_combo in one depth-first pass.
+    Each prefix is OR-ed against all later items in a single vectorized step, and
+    only the top_k combinations per size are retained.
+
+    Returns {size: [(reach_count, item_index_tuple), ...]} sorted by reach.
+    """
+    n_items = packed.shape[0]
+    max_combo = min(max_combo, n_items)
+    tops = {size: _TopK(top_k) for size in range(1, max_combo + 1)}
+    if n_items == 0:
+        return {}
+
+    tops[1].push_many(popcount(packed), lambda i: (int(i),))
+
+    # Stack of (prefix indices, prefix OR bitset)
+    stack = [((i,), packed[i]) for i in range(n_items - 1, -1, -1)]
+    while stack:
+        prefix, bits = stack.pop()
+        size = len(prefix) + 1
+        if size > max_combo:
+            continue
+        start = prefix[-1] + 1
+        if start >= n_items:
+            continue
+        extended = np.bitwise_or(bits, packed[start:])
+        counts = popcount(extended)
+        tops[size].push_many(counts, lambda i: prefix + (start + int(i),))
+        if size < max_combo:
+            for offset in range(len(extended) - 1, -1, -1):
+                stack.append((prefix + (start + offset,), extended[offset]))
+
+    return {size: top.ranked() for size, top in tops.items()}
+
+
+def run_turf(df, items, max_combo, top_k=10):
+    """Rank the best item combinations for every size from 1 to max_combo.
+
+    Returns a DataFrame with columns size, combo, reach (% of respondents) and
+    reach_count, ordered by size then descending reach.
+    """
+    items = list(items)
+    packed = pack_reach(df, items)
+    n = max(len(df), 1)
+    rows = []
+    for size, ranked in turf_exact(packed, max_combo, top_k).items():
+        for count, combo in ranked:
+            rows.append({
+                "size": size,
+                "combo": tuple(items[i] for i in combo),
+                "reach": round(count / n * 100, 2),
+                "reach_count": count,
+            })
+    return pd.DataFrame(rows, columns=["size", "combo", "reach", "reach_count"])
+
+
+def _greedy_order(packed, max_size):
+    """Greedy forward selection; the first k picks form the greedy size-k portfolio"""
+    n_bytes = packed.shape[1]
+    bits = np.zeros(n_bytes, dtype=np.uint8)
+    chosen = []
+    available = np.ones(packed.shape[0], dtype=bool)
+    for _ in range(min(max_size, packed.shape[0])):
+        counts = popcount(np.bitwise_or(bits, packed))
+        counts[~available] = -1
+        best = int(np.argmax(counts))
+        chosen.append(best)
+        available[best] = False
+        bits = bits | packed[best]
+    return chosen
+
+
+def _union(packed, combo):
+    return np.bitwise_or.reduce(packed[list(combo)], axis=0)
+
+
+def _swap_search(packed, combo, deadline):
+    """Best-improvement 1-swap local search starting from combo"""
+    combo = list(combo)
+    best = int(popcount(_union(packed, combo)))
+    k = len(combo)
+    while time.monotonic() < deadline:
+        members = packed[combo]
+        # OR of all members except position p, via prefix/suffix ORs
+        prefix = np.zeros_like(members)
+        suffix = np.zeros_like(members)
+        for p in range(1, k):
+            prefix[p] = prefix[p - 1] | members[p - 1]
+            suffix[k - 1 - p] = suffix[k - p] | members[k - p]
+        rest = prefix | suffix
+        counts = popcount(np.bitwise_or(rest[:, None, :], packed[None, :, :]))
+        counts[:, combo] = -1
+        pos, item = np.unravel_index(int(np.argmax(counts)), counts.shape)
+        if counts[pos, item] <= best:
+            break
+        combo[pos] = int(item)
+        best = int(counts[pos, item])
+    return tuple(sorted(combo)), best
+
+
+def _branch_and_bound(packed, size, incumbent, deadline, max_nodes=200_000):
+    """Best-first branch-and-bound for the size-`size` portfolio.
+
+    The bound of a node is its reach plus the sum of its largest marginal gains,
+    which is valid because reach is submodular. Returns the best portfolio found,
+    its reach and a proven upper bound on the optimal reach.
+    """
+    best_combo, best = incumbent
+    n_items = packed.shape[0]
+    n_bytes = packed.shape[1]
+    # heap entries: (-bound, tiebreak, reach, combo, next_index); bitsets are
+    # rebuilt from the combo on pop so the queue stays small
+    heap = [(-np.iinfo(np.int64).max, 0, 0, (), 0)]
+    tiebreak = 1
+    upper = None
+    while heap:
+        neg_bound, _, reach, combo, start = heap[0]
+        if -neg_bound <= best:
+            return best_combo, best, best
+        if time.monotonic() >= deadline or tiebreak > max_nodes:
+            upper = -neg_bound
+            break
+        heapq.heappop(heap)
+        bits = _union(packed, combo) if combo else np.zeros(n_bytes, dtype=np.uint8)
+        remaining = size - len(combo)
+        candidates = np.arange(start, n_items)
+        if len(candidates) < remaining:
+            continue
+        gains = popcount(np.bitwise_or(bits, packed[start:])) - reach
+        # Tightened bound for this node now that exact gains are known
+        top_gains = np.sort(gains)[::-1]
+        if reach + int(top_gains[:remaining].sum()) <= best:
+            continue
+        # Suffix-wise bound for each child: its gain plus the best remaining-1 gains after it
+        for offset in range(len(candidates) - remaining + 1):
+            j = start + offset
+            later = gains[offset + 1:]
+            extra = np.partition(later, len(later) - (remaining - 1))[len(later) - (remaining - 1):].sum() if remaining > 1 else 0
+            child_reach = reach + int(gains[offset])
+            child_bound = child_reach + int(extra)
+            if child_bound <= best:
+                continue
+            child_combo = combo + (j,)
+            if remaining == 1:
+                best, best_combo = child_reach, child_combo
+                continue
+            heapq.heappush(heap, (-child_bound, tiebreak, child_reach, child_combo, j + 1))
+            tiebreak += 1
+    if upper is None:
+        upper = best
+    return best_combo, best, max(upper, best)
+
+
+def turf_heuristic(packed, max_size, time_budget=10.0):
+    """Greedy + swap local search + branch-and-bound TURF for large item sets.
+
+    Returns {size: {"combo", "reach_count", "upper_bound", "optimal"}} where
+    upper_bound is a proven bound on the best achievable reach for that size.
+    """
+    started = time.monotonic()
+    n_items = packed.shape[0]
+    max_size = min(max_size, n_items)
+    n_respondents_bound = int(popcount(np.bitwise_or.reduce(packed, axis=0))) if n_items else 0
+    order = _greedy_order(packed, max_size)
+    order_by_reach = np.argsort(-popcount(packed), kind="stable")
+    rank = np.empty(n_items, dtype=np.int64)
+    rank[order_by_reach] = np.arange(n_items)
+    by_reach = packed[order_by_reach]
+
+    # Local search gets up to a third of the budget, branch-and-bound the rest
+    search_deadline = started + time_budget / 3
+    found = {}
+    for size in range(1, max_size + 1):
+        found[size] = _swap_search(packed, order[:size], search_deadline)
+
+    results = {}
+    for size in range(1, max_size + 1):
+        sizes_left = max_size - size + 1
+        share = max(time_budget - (time.monotonic() - started), 0) / sizes_left
+        # Branching on high-reach items first finds strong incumbents early
+        incumbent = (tuple(sorted(int(rank[i]) for i in found[size][0])), found[size][1])
+        combo, reach, upper = _branch_and_bound(by_reach, size, incumbent, time.monotonic() + share)
+        combo = tuple(sorted(int(order_by_reach[i]) for i in combo))
+        # Greedy is within 1 - (1 - 1/k)^k of optimal, which caps the bound on timeout
+        greedy_reach = int(popcount(_union(packed, order[:size])))
+        upper = min(upper, int(np.ceil(greedy_reach / (1 - (1 - 1 / size) ** size))))
+        results[size] = {
+            "combo": combo,
+            "reach_count": reach,
+            "upper_bound": min(upper, n_respondents_bound),
+            "optimal": upper <= reach,
+        }
+    return results
+
+
+def run_turf_heuristic(df, items, max_combo, time_budget=10.0):
+    """Best portfolio per size with a proven optimality gap, for large item sets.
+
+    Returns a DataFrame with columns size, combo, reach, upper_bound and gap
+    (all in % of respondents) plus an optimal flag.
+    """
+    items = list(items)
+    packed = pack_reach(df, items)
+    n = max(len(df), 1)
+    rows = []
+    for size, res in turf_heuristic(packed, max_combo, time_budget).items():
+        reach = round(res["reach_count"] / n * 100, 2)
+        upper = round(res["upper_bound"] / n * 100, 2)
+        rows.append({
+            "size": size,
+            "combo": tuple(items[i] for i in res["combo"]),
+            "reach": reach,
+            "upper_bound": upper,
+            "gap": round(upper - reach, 2),
+            "optimal": res["optimal"],
+        })
+    return pd.DataFrame(rows, columns=["size", "combo", "reach", "upper_bound", "gap", "optimal"])
+
+
+def _shapley_weights(reached):
+    """Per-respondent Shapley shares: 1 / (items reaching the respondent) for each reaching item.
+
+    For the reach (coverage) game an item's Shapley value is the sum of these
+    shares over respondents, so it is exact at any item count.
+    """
+    degree = reached.sum(axis=1, keepdims=True)
+    return np.divide(reached, degree, out=np.zeros(reached.shape, dtype=np.float32), where=degree > 0)
+
+
+def shapley_reach(df, items):
+    """Exact Shapley decomposition of total reach (% of respondents) across items"""
+    items = list(items)
+    reached = df[items].fillna(0).to_numpy() > 0
+    shares = _shapley_weights(reached)
+    values = shares.sum(axis=0, dtype=np.float64) / max(len(df), 1) * 100
+    return pd.Series(values, index=items, name="shapley").sort_values(ascending=False)
+
+
+def _bootstrap_batch(stats, n_resamples, seed):
+    """Weighted column means of `stats` for a batch of multinomial respondent resamples"""
+    rng = np.random.default_rng(seed)
+    n = stats.shape[0]
+    counts = rng.multinomial(n, np.full(n, 1 / n), size=n_resamples).astype(np.float32)
+    return counts @ stats / n * 100
+
+
+def bootstrap_turf(df, items, combos=(), n_boot=1000, confidence=0.95, n_jobs=None, seed=42):
+    """Bootstrap confidence intervals for item Shapley values and portfolio reach.
+
+    Resamples are drawn as respondent count vectors, so every batch reduces to one
+    matrix product; batches run across a process pool (n_jobs=1 runs inline).
+    Returns (shapley_ci, reach_ci) DataFrames with estimate, lower and upper columns.
+    """
+    items = list(items)
+    combos = [tuple(c) for c in combos]
+    reached = df[items].fillna(0).to_numpy() > 0
+    position = {item: i for i, item in enumerate(items)}
+    combo_reach = np.column_stack(
+        [reached[:, [position[i] for i in c]].any(axis=1) for c in combos]
+    ).astype(np.float32) if combos else np.empty((len(df), 0), dtype=np.float32)
+    stats = np.hstack([_shapley_weights(reached), combo_reach])
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    n_batches = min(n_jobs * 4, n_boot) if n_jobs > 1 else 1
+    sizes = [len(b) for b in np.array_split(np.arange(n_boot), n_batches)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            draws = list(pool.map(_bootstrap_batch, [stats] * len(sizes), sizes, seeds))
+    else:
+        draws = [_bootstrap_batch(stats, size, s) for size, s in zip(sizes, seeds)]
+    draws = np.vstack(draws)
+
+    alpha = (1 - confidence) / 2
+    lower, upper = np.quantile(draws, [alpha, 1 - alpha], axis=0)
+    estimate = stats.sum(axis=0, dtype=np.float64) / max(len(df), 1) * 100
+    m = len(items)
+    shapley_ci = pd.DataFrame(
+        {"shapley": estimate[:m], "lower": lower[:m], "upper": upper[:m]}, index=items
+    ).sort_values("shapley", ascending=False)
+    reach_ci = pd.DataFrame(
+        {"combo": combos, "reach": estimate[m:], "lower": lower[m:], "upper": upper[m:]}
+    )
+    return shapley_ci.round(2), reach_ci.round(2)
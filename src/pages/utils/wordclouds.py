@@ -0,0 +1,33 @@
+import io
+import os
+from utils import cache
+
+_CACHE_NAMESPACE = "wordclouds"
+
+
+def cached_wordcloud(corpus_key, subset, frequencies, width=800, height=300, background_color="white",
+                     max_words=200):
+    """PNG bytes of a word cloud rendered from precomputed term frequencies.
+
+    Rendering is the slow part, so the image is kept on disk keyed by the corpus
+    (e.g. topics.corpus_key), the subset it was drawn for ("all", "topic 3",
+    "Region=North", ...) and the render settings.
+    """
+    key = cache.content_key(corpus_key, subset, width, height, background_color, max_words)
+    path = cache.entry_path(_CACHE_NAMESPACE, key) + ".png"
+    if os.path.exists(path):
+        cache.touch(path)
+        with open(path, "rb") as f:
+            return f.read()
+
+    from wordcloud import WordCloud
+    cloud = WordCloud(width=width, height=height, background_color=background_color, max_words=max_words)
+    buffer = io.BytesIO()
+    cloud.generate_from_frequencies(frequencies).to_image().save(buffer, format="PNG")
+    png = buffer.getvalue()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(png)
+    os.replace(tmp, path)
+    cache.evict_lru(_CACHE_NAMESPACE)
+    return png
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from utils.distributions import sorted_columns
+
+
+def z_value(confidence):
+    """Two-sided normal critical value for a confidence level such as 0.95"""
+    return float(stats.norm.ppf((1 + confidence) / 2))
+
+
+def required_sample_size(tolerance, confidence):
+    """Rows needed for correlations (and so also proportions) to be within ±tolerance.
+
+    Uses the Fisher z interval at r = 0, where it is widest: half-width is
+    about z / sqrt(n - 3).
+    """
+    return int(np.ceil((z_value(confidence) / tolerance) ** 2 + 3))
+
+
+def choose_strata(df, max_categories=20):
+    """The categorical column with the most levels, up to max_categories, or None.
+
+    Only categorical dtypes are considered, so no column has to be scanned to
+    count its levels.
+    """
+    best, best_levels = None, 1
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype) and best_levels < len(dtype.categories) <= max_categories:
+            best, best_levels = col, len(dtype.categories)
+    return best
+
+
+def stratified_sample(df, n, strata=None, random_state=0):
+    """Proportionally allocated stratified sample of about n rows of df, in original order.
+
+    Each stratum (including missing) gets its share of n by largest remainder,
+    and at least one row, so the sample is self-weighting and small segments
+    are never lost. Without strata it is a simple random sample.
+    """
+    if n >= len(df):
+        return df
+    rng = np.random.default_rng(random_state)
+    if strata is None:
+        return df.iloc[np.sort(rng.choice(len(df), n, replace=False))]
+    members = list(df.groupby(strata, observed=True, dropna=False, sort=False).indices.values())
+    sizes = np.array([len(m) for m in members])
+    share = sizes * n / len(df)
+    take = np.floor(share).astype(np.int64)
+    take[np.argsort(take - share)[:n - take.sum()]] += 1
+    take = np.clip(take, 1, sizes)
+    positions = np.concatenate([rng.choice(m, k, replace=False) for m, k in zip(members, take)])
+    return df.iloc[np.sort(positions)]
+
+
+def _fpc(n, population_size):
+    """Finite population correction for a sample of n rows without replacement"""
+    if population_size is None or population_size <= 1:
+        return 1.0
+    return np.sqrt(np.clip((population_size - n) / (population_size - 1), 0, 1))
+
+
+def proportion_interval(k, n, confidence=0.95, population_size=None):
+    """Wilson score interval for a proportion k / n, narrowed for sampling without replacement"""
+    k, n = np.asarray(k, dtype=np.float64), np.asarray(n, dtype=np.float64)
+    z = z_value(confidence) * _fpc(n, population_size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = k / n
+        center = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return p, np.clip(center - half, 0, 1), np.clip(center + half, 0, 1)
+
+
+def correlation_intervals(r, n, confidence=0.95):
+    """Fisher z confidence interval for correlations r estimated from n rows"""
+    r, n = np.asarray(r, dtype=np.float64), np.asarray(n, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        center = np.arctanh(np.clip(r, -0.999999, 0.999999))
+        half = z_value(confidence) / np.sqrt(n - 3)
+    return np.tanh(center - half), np.tanh(center + half)
+
+
+def numeric_intervals(sample, confidence=0.95, population_size=None):
+    """Confidence intervals for each numeric column's mean, quartiles and missing share.
+
+    Means use the t interval with finite population correction; quartiles use
+    distribution-free order-statistic intervals read off the sorted sample.
+    Returns a DataFrame indexed by column.
+    """
+    numeric = sample.select_dtypes(include=np.number)
+    values, n = sorted_columns(numeric)
+    z = z_value(confidence)
+    rows = {}
+    for j, col in enumerate(numeric.columns):
+        column, m = values[j, :n[j]], int(n[j])
+        row = {"n": m}
+        if m > 1:
+            mean = column.mean()
+            half = stats.t.ppf((1 + confidence) / 2, m - 1) * column.std(ddof=1) / np.sqrt(m) * _fpc(m, population_size)
+            row.update(mean=mean, mean_low=mean - half, mean_high=mean + half)
+            for q, name in ((0.25, "q1"), (0.5, "median"), (0.75, "q3")):
+                # Ranks whose order statistics bracket the q-quantile with the requested coverage
+                spread = z * np.sqrt(m * q * (1 - q))
+                low = int(np.clip(np.floor(m * q - spread), 0, m - 1))
+                high = int(np.clip(np.ceil(m * q + spread), 0, m - 1))
+                row.update({name: np.quantile(column, q), f"{name}_low": column[low], f"{name}_high": column[high]})
+        missing, missing_low, missing_high = proportion_interval(len(sample) - m, len(sample), confidence, population_size)
+        row.update(missing_pct=100 * missing, missing_pct_low=100 * missing_low, missing_pct_high=100 * missing_high)
+        rows[col] = row
+    return pd.DataFrame.from_dict(rows, orient="index")
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+CACHE_ROOT = os.getenv("SAMI_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sami_ai_cache"))
+MAX_CACHE_BYTES = int(float(os.getenv("SAMI_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+
+
+def content_key(*parts):
+    """SHA-256 hex digest over bytes / str parts, used as a content-addressed cache key"""
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, (bytes, bytearray, memoryview)):
+            part = str(part).encode("utf-8")
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def namespace_dir(namespace):
+    path = os.path.join(CACHE_ROOT, namespace)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def entry_path(namespace, key):
+    return os.path.join(namespace_dir(namespace), key)
+
+
+def touch(path):
+    """Mark an entry as recently used; eviction is least-recently-used by mtime"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def staging_dir(namespace):
+    """Temporary directory inside the namespace; publish it with commit_dir"""
+    return tempfile.mkdtemp(prefix=".tmp-", dir=namespace_dir(namespace))
+
+
+def commit_dir(tmp_path, final_path):
+    """Atomically publish a staged entry; a concurrent writer winning the race is fine"""
+    try:
+        os.rename(tmp_path, final_path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def _entry_size(path):
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files
+        )
+    return os.path.getsize(path)
+
+
+def evict_lru(namespace, max_bytes=MAX_CACHE_BYTES):
+    """Delete least-recently-used entries until the namespace fits in max_bytes"""
+    base = namespace_dir(namespace)
+    entries = []
+    for name in os.listdir(base):
+        path = os.path.join(base, name)
+        try:
+            if name.startswith(".tmp-"):
+                # Leftover from an interrupted write
+                if time.time() - os.path.getmtime(path) > 3600:
+                    shutil.rmtree(path, ignore_errors=True)
+                continue
+            entries.append((os.path.getmtime(path), _entry_size(path), path))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+        total -= size
@@ -0,0 +1,149 @@
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.model_selection import train_test_split
+from utils import cache
+
+# Bump when features, models or the result format change
+DRIVERS_VERSION = "2"
+_CACHE_NAMESPACE = "drivers"
+
+
+def prepare_features(df, target, features, max_categories=20):
+    """Model matrix for a driver analysis.
+
+    Numeric features are median-imputed; categorical features with at most
+    max_categories levels are one-hot encoded, others are dropped. Rows with a
+    missing target are removed. Returns (X, y, groups) where groups maps each
+    original feature to its columns in X.
+    """
+    data = df[df[target].notna()]
+    parts, groups = [], {}
+    for col in features:
+        series = data[col]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            parts.append(series.fillna(series.median()).astype(np.float32).rename(col))
+            groups[col] = [col]
+        elif series.nunique() <= max_categories:
+            dummies = pd.get_dummies(series.astype("category"), prefix=col, dtype=np.float32)
+            parts.append(dummies)
+            groups[col] = list(dummies.columns)
+    if not parts:
+        raise ValueError("No usable feature columns for the driver analysis.")
+    return pd.concat(parts, axis=1), data[target], groups
+
+
+def is_classification(y):
+    """Categorical, boolean and binary targets are classes; other numeric targets
+    (ratings, NPS, spend) are regression, whatever their number of levels"""
+    if pd.api.types.is_bool_dtype(y) or not pd.api.types.is_numeric_dtype(y):
+        return True
+    return y.nunique() <= 2
+
+
+def _group_importance(model, X, y, columns, baseline, n_repeats, seed):
+    """Mean and std drop in score when the columns of one feature are shuffled together"""
+    rng = np.random.default_rng(seed)
+    drops = []
+    for _ in range(n_repeats):
+        shuffled = X.copy()
+        shuffled[:, columns] = X[rng.permutation(len(X))][:, columns]
+        drops.append(baseline - model.score(shuffled, y))
+    return float(np.mean(drops)), float(np.std(drops))
+
+
+def permutation_importance(model, X, y, groups, n_repeats=5, n_jobs=None, batch_size=8, seed=42):
+    """Grouped permutation importance, computed in parallel batches of features.
+
+    One-hot columns of a categorical feature are permuted together so each
+    original feature gets a single importance. Tree prediction releases the
+    GIL, so batches run on threads without copying the model.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    y = np.asarray(y)
+    baseline = model.score(X, y)
+    names = list(groups)
+    seeds = np.random.SeedSequence(seed).generate_state(len(names))
+
+    def run_batch(batch):
+        return [
+            _group_importance(model, X, y, groups[name], baseline, n_repeats, int(seeds[i]))
+            for i, name in batch
+        ]
+
+    batches = [list(enumerate(names))[i:i + batch_size] for i in range(0, len(names), batch_size)]
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count() or 1) as pool:
+        results = [r for batch in pool.map(run_batch, batches) for r in batch]
+    return pd.DataFrame(results, index=names, columns=["importance", "std"])
+
+
+def fit_drivers(df, target, features, max_categories=20, n_estimators=100, max_fit_rows=50_000,
+                max_eval_rows=20_000, n_repeats=5, random_state=42, task=None):
+    """Fit a random forest for target on all cores and rank its drivers.
+
+    task is "classification" or "regression"; by default it is inferred with
+    is_classification.
+
+    Results are cached on disk by dataset content, target, features and
+    settings, so reruns (e.g. after changing a chart option) do not refit.
+    Returns a dict with task, holdout score, importance DataFrame (permutation
+    importance, its std, impurity importance and direction for numeric
+    features) and the fitted model.
+    """
+    features = [f for f in features if f != target]
+    columns = features + [target]
+    data_hash = pd.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes()
+    key = cache.content_key(data_hash, columns, max_categories, n_estimators, max_fit_rows, max_eval_rows,
+                            n_repeats, random_state, task, DRIVERS_VERSION)
+    path = cache.entry_path(_CACHE_NAMESPACE, key) + ".pkl"
+    if os.path.exists(path):
+        cache.touch(path)
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    X, y, groups = prepare_features(df, target, features, max_categories)
+    classification = is_classification(y) if task is None else task == "classification"
+    if classification:
+        y = y.astype(str)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X.to_numpy(), y.to_numpy(), test_size=0.2, random_state=random_state,
+        stratify=y if classification and y.value_counts().min() > 1 else None
+    )
+    # The split is shuffled, so leading rows are random samples; bounding them keeps
+    # large files fast (max_samples alone still makes every tree scan all rows)
+    X_train, y_train = X_train[:max_fit_rows], y_train[:max_fit_rows]
+    X_test, y_test = X_test[:max_eval_rows], y_test[:max_eval_rows]
+    model_cls = RandomForestClassifier if classification else RandomForestRegressor
+    model = model_cls(
+        n_estimators=n_estimators, min_samples_leaf=10, max_features="sqrt" if classification else 1 / 3,
+        n_jobs=-1, random_state=random_state,
+    ).fit(X_train, y_train)
+
+    index = {col: i for i, col in enumerate(X.columns)}
+    importance = permutation_importance(
+        model, X_test, y_test, {name: [index[c] for c in cols] for name, cols in groups.items()},
+        n_repeats=n_repeats, seed=random_state
+    )
+    importance["impurity_importance"] = [
+        model.feature_importances_[[index[c] for c in cols]].sum() for cols in groups.values()
+    ]
+    if not classification:
+        numeric = [name for name, cols in groups.items() if cols == [name]]
+        correlation = X[numeric].corrwith(y, method="spearman")
+        importance["direction"] = np.sign(correlation).map({1.0: "+", -1.0: "−"}).reindex(importance.index)
+    result = {
+        "task": "classification" if classification else "regression",
+        "score": float(model.score(X_test, y_test)),
+        "importance": importance.sort_values("importance", ascending=False),
+        "model": model,
+        "n_rows": len(X),
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    cache.evict_lru(_CACHE_NAMESPACE)
+    return result
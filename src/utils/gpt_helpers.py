@@ -1,17 +1,382 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+from collections import deque, defaultdict
+from utils import cache
+import asyncio
+import contextlib
+import json
+import random
+import threading
+import time
 import os
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+LLM_TIMEOUT = float(os.getenv("SAMI_LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("SAMI_LLM_MAX_RETRIES", "3"))
+LLM_MAX_INFLIGHT = int(os.getenv("SAMI_LLM_MAX_INFLIGHT", "8"))
+LLM_CACHE_TTL = float(os.getenv("SAMI_LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(float(os.getenv("SAMI_LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+_LLM_NAMESPACE = "llm"
+_EVICT_EVERY = 50
+_writes_since_evict = 0
+
+
+# === BACKENDS ===
+class OpenAIBackend:
+    """Real API backend; one pooled client per process, built on first use"""
+
+    offline = False
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                # Retries are handled by the gateway so they can be jittered and counted
+                self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=LLM_TIMEOUT, max_retries=0)
+            return self._client
+
+    def available(self):
+        return bool(os.getenv("OPENAI_API_KEY"))
+
+    def complete(self, model, messages, **params):
+        response = self.client.chat.completions.create(model=model, messages=messages, **params)
+        return response.choices[0].message.content, _usage_dict(getattr(response, "usage", None))
+
+    def async_client(self, base_url=None):
+        return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=base_url, timeout=LLM_TIMEOUT, max_retries=0)
+
+    def generate_image(self, prompt, **params):
+        return self.client.images.generate(prompt=prompt, **params).data[0].url
+
+
+class EchoBackend:
+    """Offline backend that echoes the last user message, for tests and benchmarks"""
+
+    offline = True
+
+    def __init__(self, max_chars=500):
+        self.max_chars = max_chars
+
+    def available(self):
+        return True
+
+    def complete(self, model, messages, **params):
+        last = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        content = f"[echo:{model}] {str(last)[:self.max_chars]}"
+        prompt_tokens = estimate_tokens(messages)
+        return content, {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4}
+
+    def generate_image(self, prompt, **params):
+        raise RuntimeError("Image generation is not available with an offline LLM backend")
+
+
+class CannedBackend(EchoBackend):
+    """Offline backend returning fixed replies: the first canned key found in the
+    last user message wins, else the default reply. Replies can be loaded from
+    a JSON object file via SAMI_LLM_CANNED_FILE."""
+
+    def __init__(self, replies=None, default="This is a canned offline response."):
+        super().__init__()
+        if replies is None and os.getenv("SAMI_LLM_CANNED_FILE"):
+            with open(os.getenv("SAMI_LLM_CANNED_FILE"), encoding="utf-8") as f:
+                replies = json.load(f)
+        self.replies = replies or {}
+        self.default = default
+
+    def complete(self, model, messages, **params):
+        last = str(next((m["content"] for m in reversed(messages) if m.get("role") == "user"), ""))
+        content = next((reply for key, reply in self.replies.items() if key in last), self.default)
+        return content, {"prompt_tokens": estimate_tokens(messages), "completion_tokens": len(content) // 4}
+
+
+_BACKENDS = {"openai": OpenAIBackend, "echo": EchoBackend, "canned": CannedBackend}
+_backend = _BACKENDS.get(os.getenv("SAMI_LLM_BACKEND", "openai").lower(), OpenAIBackend)()
+_inflight = threading.BoundedSemaphore(LLM_MAX_INFLIGHT)
+
+
+def get_backend():
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the process-wide backend: an instance, or one of "openai", "echo", "canned" """
+    global _backend
+    _backend = _BACKENDS[backend]() if isinstance(backend, str) else backend
+    return _backend
+
+
+def llm_available():
+    return _backend.available()
+
+
+# === USAGE ACCOUNTING ===
+_usage_lock = threading.Lock()
+_usage = defaultdict(lambda: {
+    "requests": 0, "cache_hits": 0, "errors": 0, "retries": 0,
+    "prompt_tokens": 0, "completion_tokens": 0, "latency_s": 0.0,
+})
+
+
+def _usage_dict(usage):
+    if usage is None:
+        return {}
+    return {"prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0}
+
+
+def _record(module, **counts):
+    with _usage_lock:
+        row = _usage[module]
+        for name, value in counts.items():
+            row[name] += value
+
+
+def usage_summary():
+    """Per-module request, cache-hit, retry, token and latency counters for this process"""
+    with _usage_lock:
+        return [
+            {"module": module, **row, "latency_s": round(row["latency_s"], 3),
+             "avg_latency_s": round(row["latency_s"] / row["requests"], 2) if row["requests"] else 0.0}
+            for module, row in sorted(_usage.items())
+        ]
+
+
+# === RESPONSE CACHE ===
+def llm_cache_key(model, messages, params):
+    payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, default=str)
+    return cache.content_key(payload)
+
+
+def llm_cache_get(key, ttl=LLM_CACHE_TTL):
+    """Cached reply text for key, or None when missing or older than ttl seconds"""
+    path = cache.entry_path(_LLM_NAMESPACE, key + ".json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if ttl is not None and time.time() - entry.get("created", 0) > ttl:
+        return None
+    cache.touch(path)
+    return entry.get("content")
+
+
+def llm_cache_put(key, content):
+    global _writes_since_evict
+    path = cache.entry_path(_LLM_NAMESPACE, key + ".json")
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"created": time.time(), "content": content}, f)
+    os.replace(tmp, path)
+    _writes_since_evict += 1
+    if _writes_since_evict >= _EVICT_EVERY:
+        _writes_since_evict = 0
+        cache.evict_lru(_LLM_NAMESPACE, LLM_CACHE_MAX_BYTES)
+
+
+# === GATEWAY ===
+def chat_completion(messages, model="gpt-3.5-turbo", module="default", use_cache=True, ttl=LLM_CACHE_TTL,
+                    max_retries=LLM_MAX_RETRIES, **params):
+    """Reply text for a chat completion, routed through the process-wide gateway.
+
+    Replies come from the on-disk LLM cache when possible (keyed on model,
+    messages and extra parameters; use_cache=False forces a fresh request).
+    Live calls share one pooled client, wait for an in-flight slot, retry
+    transient errors with jittered backoff and are accounted under `module`.
+    Offline backends are never cached, so switching back to the API is clean.
+    """
+    backend = _backend
+    cacheable = not backend.offline
+    key = llm_cache_key(model, messages, params)
+    if use_cache and cacheable:
+        content = llm_cache_get(key, ttl)
+        if content is not None:
+            _record(module, cache_hits=1)
+            return content
+    for attempt in range(max_retries + 1):
+        started = time.monotonic()
+        try:
+            with _inflight:
+                content, usage = backend.complete(model, messages, **params)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                _record(module, errors=1)
+                raise
+            _record(module, retries=1)
+            time.sleep(_retry_delay(e, attempt))
+            continue
+        except Exception:
+            _record(module, errors=1)
+            raise
+        _record(module, requests=1, latency_s=time.monotonic() - started, **usage)
+        if cacheable:
+            llm_cache_put(key, content)
+        return content
+
+
+def generate_image(prompt, module="default", **params):
+    """Image URL from the active backend (offline backends raise RuntimeError)"""
+    started = time.monotonic()
+    with _inflight:
+        url = _backend.generate_image(prompt, **params)
+    _record(module, requests=1, latency_s=time.monotonic() - started)
+    return url
+
 
 def summarize_gpt_slide_text(prompt):
     try:
-        response = client.chat.completions.create(
+        return chat_completion(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a helpful AI assistant for data summarization."},
                 {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message.content.strip()
+            ],
+            module="CrossTabs"
+        ).strip()
     except Exception as e:
-        return f"❌ Error with GPT: {e}"
\ No newline at end of file
+        return f"❌ Error with GPT: {e}"
+
+
+def estimate_tokens(messages, max_tokens=0):
+    """Rough token count (~4 chars per token) used for tokens-per-minute budgeting"""
+    return sum(len(str(m.get("content", ""))) // 4 + 4 for m in messages) + (max_tokens or 0)
+
+
+class RateLimiter:
+    """Sliding 60-second window over requests-per-minute and tokens-per-minute budgets"""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = deque()
+        self.tokens_in_window = 0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.tpm)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                while self.window and now - self.window[0][0] >= 60:
+                    self.tokens_in_window -= self.window.popleft()[1]
+                if len(self.window) < self.rpm and self.tokens_in_window + tokens <= self.tpm:
+                    self.window.append((now, tokens))
+                    self.tokens_in_window += tokens
+                    return
+                await asyncio.sleep(max(60 - (now - self.window[0][0]), 0.05))
+
+
+def _retry_delay(error, attempt):
+    """Server-provided Retry-After when present, else jittered exponential backoff"""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 60) * (0.5 + random.random())
+
+
+@contextlib.asynccontextmanager
+async def _inflight_slot():
+    """Async acquire of the process-wide in-flight cap, without blocking the event loop"""
+    while not _inflight.acquire(blocking=False):
+        await asyncio.sleep(0.02)
+    try:
+        yield
+    finally:
+        _inflight.release()
+
+
+async def _complete(aclient, limiter, semaphore, messages, model, max_retries, params, use_cache=True, module="default"):
+    backend = _backend
+    key = llm_cache_key(model, messages, params)
+    if use_cache and not backend.offline:
+        content = llm_cache_get(key)
+        if content is not None:
+            _record(module, cache_hits=1)
+            return content
+    tokens = estimate_tokens(messages, params.get("max_tokens"))
+    for attempt in range(max_retries + 1):
+        if not backend.offline:
+            await limiter.acquire(tokens)
+        # The batch's own concurrency first, then the cap shared with every other session
+        async with semaphore, _inflight_slot():
+            started = time.monotonic()
+            try:
+                if backend.offline:
+                    content, usage = backend.complete(model, messages, **params)
+                else:
+                    response = await aclient.chat.completions.create(model=model, messages=messages, **params)
+                    content, usage = response.choices[0].message.content, _usage_dict(getattr(response, "usage", None))
+            except RETRYABLE_ERRORS as e:
+                if attempt == max_retries:
+                    _record(module, errors=1)
+                    raise
+                _record(module, retries=1)
+                delay = _retry_delay(e, attempt)
+            except Exception:
+                _record(module, errors=1)
+                raise
+            else:
+                _record(module, requests=1, latency_s=time.monotonic() - started, **usage)
+                if not backend.offline:
+                    llm_cache_put(key, content)
+                return content
+        await asyncio.sleep(delay)
+
+
+async def chat_batch_async(message_lists, model="gpt-4", rpm=500, tpm=90_000, concurrency=16,
+                           max_retries=5, on_result=None, aclient=None, base_url=None, use_cache=True,
+                           module="default", **params):
+    """Run many chat completions concurrently under RPM/TPM budgets.
+
+    Returns one entry per message list, in input order: the reply text, or the
+    exception raised once retries are exhausted. on_result(index, result) is
+    called as each request finishes, in completion order. Replies already in the
+    LLM cache are returned without touching the rate limiter.
+    """
+    owns_client = aclient is None and not _backend.offline
+    if owns_client:
+        # Async clients are bound to their event loop, so each batch pools its own and closes it
+        aclient = _backend.async_client(base_url)
+    limiter = RateLimiter(rpm, tpm)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index, messages):
+        try:
+            return index, await _complete(aclient, limiter, semaphore, messages, model, max_retries, params, use_cache, module)
+        except Exception as e:
+            return index, e
+
+    results = [None] * len(message_lists)
+    tasks = [asyncio.ensure_future(run(i, m)) for i, m in enumerate(message_lists)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            index, result = await finished
+            results[index] = result
+            if on_result:
+                on_result(index, result)
+    finally:
+        for task in tasks:
+            task.cancel()
+        if owns_client:
+            await aclient.close()
+    return results
+
+
+def chat_batch(message_lists, **kwargs):
+    """Blocking wrapper around chat_batch_async, safe to call from a Streamlit script"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(chat_batch_async(message_lists, **kwargs))
+    # Already inside an event loop: run the batch on a private loop in a worker thread
+    box = {}
+    worker = threading.Thread(target=lambda: box.update(out=asyncio.run(chat_batch_async(message_lists, **kwargs))))
+    worker.start()
+    worker.join()
+    return box["out"]
@@ -0,0 +1,130 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from utils import cache
+from utils.distributions import distribution_summaries, sorted_columns
+
+# Bump when the statistics or the profile format change
+PROFILE_VERSION = "1"
+_CACHE_NAMESPACE = "profiles"
+
+PROFILE_COLUMNS = [
+    "dtype", "count", "missing", "missing_pct", "unique", "mean", "std", "skew", "kurtosis",
+    "min", "25%", "50%", "75%", "max", "top", "freq", "top_values",
+]
+
+
+def dataset_key(df):
+    """Content hash of a DataFrame (values, column names and dtypes)"""
+    data_hash = pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()
+    return cache.content_key(data_hash, list(df.columns), list(df.dtypes.astype(str)))
+
+
+def _format_top(values, counts, total):
+    return ", ".join(f"{v} ({100 * c / total:.0f}%)" for v, c in zip(values, counts)) if total else ""
+
+
+def _numeric_column(column, top_n):
+    """Moments, cardinality and most frequent values of one sorted, NaN-free column"""
+    n = len(column)
+    stats = {"unique": 0, "mean": np.nan, "std": np.nan, "skew": np.nan, "kurtosis": np.nan,
+             "top": np.nan, "freq": np.nan, "top_values": ""}
+    if not n:
+        return stats
+    mean = column.mean()
+    d = column - mean
+    d2 = d * d
+    m2, m3, m4 = d2.mean(), (d2 * d).mean(), (d2 * d2).mean()
+    stats["mean"] = mean
+    if n > 1:
+        stats["std"] = np.sqrt(m2 * n / (n - 1))
+    # Bias-corrected, as pandas skew() and kurt() report them
+    if n > 2 and m2 > 0:
+        stats["skew"] = np.sqrt(n * (n - 1)) / (n - 2) * m3 / m2 ** 1.5
+    if n > 3 and m2 > 0:
+        stats["kurtosis"] = ((n + 1) * (m4 / m2 ** 2 - 3) + 6) * (n - 1) / ((n - 2) * (n - 3))
+    # Equal values are adjacent once sorted, so runs give distinct values and their counts
+    starts = np.r_[0, np.flatnonzero(column[1:] != column[:-1]) + 1]
+    runs = np.diff(np.r_[starts, n])
+    best = np.argsort(-runs, kind="stable")[:top_n]
+    stats["unique"] = len(starts)
+    stats["top"], stats["freq"] = column[starts[best[0]]], int(runs[best[0]])
+    stats["top_values"] = _format_top([f"{v:g}" for v in column[starts[best]]], runs[best], n)
+    return stats
+
+
+def _other_column(series, top_n):
+    """Cardinality and most frequent values of a categorical, text, boolean or date column"""
+    counts = series.value_counts(dropna=True)
+    total = int(counts.sum())
+    return {
+        "unique": len(counts),
+        "top": counts.index[0] if len(counts) else np.nan,
+        "freq": int(counts.iloc[0]) if len(counts) else np.nan,
+        "top_values": _format_top(counts.index[:top_n], counts.to_numpy()[:top_n], total),
+    }
+
+
+def profile_dataset(df, top_n=5, bins=30):
+    """One profiling pass over df, shared by every summary of the dataset.
+
+    Numeric columns are sorted once; counts, moments (mean, std, skew,
+    kurtosis), quartiles, cardinality, most frequent values and histogram /
+    box-plot aggregates are all read off the sorted values. Other columns get
+    counts, cardinality and top values from a single value_counts. Profiles
+    are cached on disk by dataset content, so reruns and every consumer
+    reuse the same result. Returns a dict with n_rows, n_columns, a per-column
+    columns DataFrame (PROFILE_COLUMNS) and the numeric distributions
+    (as distribution_summaries returns them).
+    """
+    key = cache.content_key(dataset_key(df), top_n, bins, PROFILE_VERSION)
+    path = cache.entry_path(_CACHE_NAMESPACE, key) + ".pkl"
+    if os.path.exists(path):
+        cache.touch(path)
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    numeric = df.select_dtypes(include=np.number)
+    values, n = sorted_columns(numeric)
+    distributions = distribution_summaries(numeric, bins=bins, presorted=(values, n))
+    box = distributions["box"]
+
+    rows = {}
+    for j, col in enumerate(numeric.columns):
+        rows[col] = {**_numeric_column(values[j, :n[j]], top_n), "min": box["min"].iloc[j],
+                     "25%": box["q1"].iloc[j], "50%": box["median"].iloc[j], "75%": box["q3"].iloc[j],
+                     "max": box["max"].iloc[j]}
+    del values
+    for col in df.columns:
+        if col not in rows:
+            rows[col] = _other_column(df[col], top_n)
+
+    columns = pd.DataFrame.from_dict(rows, orient="index").reindex(index=df.columns, columns=PROFILE_COLUMNS)
+    count = df.notna().sum()
+    columns["dtype"] = df.dtypes.astype(str)
+    columns["count"] = count
+    columns["missing"] = len(df) - count
+    columns["missing_pct"] = 100 * columns["missing"] / max(len(df), 1)
+
+    profile = {"n_rows": len(df), "n_columns": df.shape[1], "columns": columns, "distributions": distributions}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(profile, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    cache.evict_lru(_CACHE_NAMESPACE)
+    return profile
+
+
+def describe_profile(profile):
+    """The profile laid out like DataFrame.describe(include='all')"""
+    columns = profile["columns"]
+    table = columns[["count", "unique", "top", "freq", "mean", "std", "min", "25%", "50%", "75%", "max"]]
+    return table.T.astype(object)
+
+
+def profile_table(profile, max_columns=60):
+    """Compact per-column summary, e.g. to give a language model the shape of the data"""
+    columns = profile["columns"].head(max_columns)
+    table = columns[["dtype", "missing_pct", "unique", "mean", "std", "min", "50%", "max", "top_values"]]
+    return table.round({"missing_pct": 1, "mean": 3, "std": 3, "min": 3, "50%": 3, "max": 3})
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA, IncrementalPCA
+
+
+def _chunks(n, chunk_rows):
+    return [(start, min(start + chunk_rows, n)) for start in range(0, n, chunk_rows)]
+
+
+def fit_pca(df, columns=None, n_components=2, chunk_rows=100_000, random_state=0):
+    """Principal components of the numeric columns of df, scaled to unit variance.
+
+    Missing values are mean-imputed instead of dropping rows. Up to chunk_rows
+    rows use randomized SVD; larger frames are fed to IncrementalPCA one chunk
+    at a time, so only a chunk is ever held as float64. Returns a dict with the
+    float32 projection, explained_variance_ratio and loadings (columns x PCs).
+    """
+    numeric = df[columns] if columns is not None else df.select_dtypes(include=np.number)
+    mean = numeric.mean().to_numpy()
+    std = numeric.std(ddof=0).to_numpy()
+    std = np.where(std > 0, std, 1.0)
+    n_components = min(n_components, numeric.shape[1])
+
+    def block(start, stop):
+        X = numeric.iloc[start:stop].to_numpy(dtype=np.float64, na_value=np.nan)
+        return np.nan_to_num((X - mean) / std, nan=0.0)
+
+    if len(numeric) <= chunk_rows:
+        model = PCA(n_components=n_components, svd_solver="randomized", random_state=random_state)
+        projection = model.fit_transform(block(0, len(numeric))).astype(np.float32)
+    else:
+        model = IncrementalPCA(n_components=n_components)
+        spans = _chunks(len(numeric), chunk_rows)
+        # A short last chunk would be smaller than n_components; fold it into the previous one
+        if len(spans) > 1 and spans[-1][1] - spans[-1][0] < n_components:
+            spans[-2:] = [(spans[-2][0], spans[-1][1])]
+        for start, stop in spans:
+            model.partial_fit(block(start, stop))
+        projection = np.empty((len(numeric), n_components), dtype=np.float32)
+        for start, stop in spans:
+            projection[start:stop] = model.transform(block(start, stop))
+
+    names = [f"PC{i + 1}" for i in range(n_components)]
+    return {
+        "projection": projection,
+        "explained_variance_ratio": pd.Series(model.explained_variance_ratio_, index=names),
+        "loadings": pd.DataFrame(model.components_.T, index=numeric.columns, columns=names),
+    }
+
+
+def density_grid(x, y, bins=200, clip=(0.1, 99.9)):
+    """2D histogram of a point cloud computed server-side.
+
+    The plotted range is clipped to the given percentiles so a few extreme
+    points do not squash the grid. Returns (counts[y, x], x_centers, y_centers).
+    """
+    x_range = np.percentile(x, clip)
+    y_range = np.percentile(y, clip)
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins, range=[x_range, y_range])
+    return counts.T, (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2
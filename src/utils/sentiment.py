@@ -0,0 +1,208 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from utils import cache
+
+# Bump when the lexicon or scoring rules change
+SENTIMENT_VERSION = "2"
+_CACHE_NAMESPACE = "sentiment"
+
+# Valence on a -4..+4 scale, tuned for survey verbatims
+LEXICON = {
+    # positive
+    "good": 1.9, "great": 3.1, "excellent": 3.2, "amazing": 2.8, "awesome": 3.1, "fantastic": 2.6,
+    "wonderful": 2.7, "outstanding": 3.0, "superb": 3.1, "perfect": 2.7, "brilliant": 2.8, "best": 3.2,
+    "better": 1.9, "nice": 1.8, "fine": 0.8, "ok": 0.9, "okay": 0.9, "decent": 1.0, "solid": 1.2,
+    "love": 3.2, "loved": 2.9, "loves": 2.7, "like": 1.5, "liked": 1.8, "enjoy": 2.2, "enjoyed": 2.3,
+    "happy": 2.7, "glad": 2.0, "pleased": 1.9, "satisfied": 1.8, "delighted": 2.9, "thrilled": 2.9,
+    "impressed": 2.2, "impressive": 2.3, "recommend": 1.5, "recommended": 1.6, "helpful": 1.8,
+    "friendly": 2.2, "polite": 1.6, "kind": 2.0, "courteous": 1.8, "professional": 1.3, "knowledgeable": 1.4,
+    "fast": 1.2, "quick": 1.3, "quickly": 1.1, "prompt": 1.2, "efficient": 1.8, "easy": 1.9, "simple": 1.1,
+    "convenient": 1.7, "smooth": 1.5, "seamless": 1.7, "reliable": 1.8, "clean": 1.5, "fresh": 1.3,
+    "comfortable": 1.5, "affordable": 1.3, "cheap": 0.5, "value": 1.0, "worth": 1.2, "quality": 0.6,
+    "useful": 1.7, "valuable": 2.0, "intuitive": 1.6, "responsive": 1.4, "accurate": 1.5, "clear": 1.2,
+    "beautiful": 2.9, "lovely": 2.8, "pleasant": 2.3, "fun": 2.3, "exciting": 2.2, "cool": 1.3,
+    "thank": 1.5, "thanks": 1.9, "grateful": 2.0, "appreciate": 1.7, "appreciated": 2.3, "trust": 2.3,
+    "safe": 1.9, "secure": 1.4, "improved": 1.8, "improvement": 1.3, "success": 2.7, "successful": 2.8,
+    "benefit": 2.0, "benefits": 1.6, "wow": 2.8, "yes": 1.7, "win": 2.8, "well": 1.1, "favorite": 2.0,
+    "favourite": 2.0, "incredible": 2.4, "exceptional": 2.8, "positive": 2.6, "attentive": 1.8,
+    "caring": 2.2, "patient": 1.4, "generous": 2.3, "flexible": 1.2, "smart": 1.7, "handy": 1.4,
+    "resolved": 1.3, "fixed": 0.9, "works": 0.8, "working": 0.5, "enjoyable": 2.4, "superior": 2.3,
+    # negative
+    "bad": -2.5, "poor": -2.1, "terrible": -2.9, "awful": -3.1, "horrible": -2.5, "worst": -3.1,
+    "worse": -2.1, "hate": -2.7, "hated": -3.2, "dislike": -1.6, "disliked": -1.7, "annoying": -1.9,
+    "annoyed": -1.6, "angry": -2.3, "upset": -1.6, "frustrated": -2.3, "frustrating": -2.2,
+    "frustration": -2.1, "disappointed": -1.9, "disappointing": -2.2, "disappointment": -2.3,
+    "unhappy": -1.8, "sad": -2.1, "unacceptable": -2.4, "useless": -2.3, "pointless": -1.7,
+    "slow": -1.1, "slowly": -0.9, "late": -1.1, "delay": -1.3, "delayed": -1.4, "delays": -1.3,
+    "wait": -0.6, "waiting": -0.8, "expensive": -1.3, "overpriced": -1.9, "pricey": -1.0, "costly": -1.4,
+    "rude": -2.0, "unfriendly": -1.9, "unhelpful": -1.9, "unprofessional": -2.0, "incompetent": -2.5,
+    "ignored": -1.6, "confusing": -1.6, "confused": -1.3, "complicated": -1.2, "difficult": -1.5,
+    "hard": -0.6, "broken": -1.8, "broke": -1.7, "bug": -1.2, "buggy": -1.9, "bugs": -1.2,
+    "crash": -1.7, "crashes": -1.7, "crashed": -1.7, "crashing": -1.8, "error": -1.4, "errors": -1.4,
+    "fail": -2.3, "failed": -2.3, "fails": -2.2, "failure": -2.3, "problem": -1.7, "problems": -1.7,
+    "issue": -1.0, "issues": -1.0, "complaint": -1.5, "complain": -1.5, "wrong": -2.1, "mistake": -1.4,
+    "missing": -1.2, "lost": -1.3, "damaged": -1.9, "dirty": -1.9, "cold": -0.5, "noisy": -1.1,
+    "unreliable": -1.9, "inconvenient": -1.6, "uncomfortable": -1.6, "unclear": -1.1, "misleading": -2.0,
+    "scam": -2.6, "fraud": -2.8, "waste": -1.8, "wasted": -2.2, "cancel": -1.0, "cancelled": -1.1,
+    "refund": -0.7, "nightmare": -2.6, "disaster": -3.1, "pathetic": -2.7, "ridiculous": -2.1,
+    "stupid": -2.4, "boring": -1.3, "mediocre": -1.2, "lacking": -1.1, "lack": -1.1, "lacks": -1.1,
+    "worried": -1.6, "worry": -1.4, "concern": -0.8,
+    "concerned": -1.1, "stress": -1.8, "stressful": -2.0, "painful": -1.9, "pain": -2.0, "hassle": -1.6,
+    "tedious": -1.5, "clunky": -1.4, "outdated": -1.2, "inaccurate": -1.7, "unusable": -2.2,
+    "unresponsive": -1.8, "sucks": -1.5, "sucked": -2.0, "meh": -0.6, "regret": -1.8, "avoid": -1.2,
+    "negative": -2.7, "dissatisfied": -1.9, "unsatisfied": -1.8, "fault": -1.7, "faulty": -1.8,
+    "hidden": -0.5, "charged": -0.6, "overcharged": -2.0, "spam": -1.5, "impossible": -1.6,
+}
+
+NEGATIONS = {
+    "not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "nowhere", "cannot", "without",
+    "hardly", "barely", "scarcely", "dont", "didnt", "doesnt", "isnt", "wasnt", "arent", "werent", "wont",
+    "cant", "couldnt", "wouldnt", "shouldnt", "havent", "hasnt", "hadnt", "aint",
+}
+
+# Scalar added to (or taken from) the magnitude of the following sentiment word
+BOOSTERS = {
+    "very": 0.293, "really": 0.293, "extremely": 0.293, "so": 0.293, "super": 0.293, "totally": 0.293,
+    "absolutely": 0.293, "incredibly": 0.293, "highly": 0.293, "truly": 0.293, "completely": 0.293,
+    "most": 0.293, "too": 0.293, "especially": 0.293, "exceptionally": 0.293, "utterly": 0.293,
+    "quite": 0.1, "pretty": 0.1, "more": 0.1,
+    "slightly": -0.293, "somewhat": -0.293, "barely": -0.293, "little": -0.293, "kinda": -0.293,
+    "sorta": -0.293, "marginally": -0.293, "partly": -0.293, "less": -0.293,
+}
+
+NEGATION_SCALAR = -0.74
+# Boosters and negators reach up to three words ahead, fading with distance
+_WINDOW_DECAY = (1.0, 0.95, 0.9)
+
+
+_BOUNDARY = "."
+_SEPARATOR = "\x01"
+# Straight or typographic apostrophe (phones and word processors type ’)
+_CONTRACTION = re.compile(r"n['’‘]t\b")
+_CLAUSE = re.compile(r"[.,;:!?()]+")
+_OTHER = re.compile(r"[^a-z0-9.\x01\s]+")
+
+
+def _tokenize(texts):
+    """All tokens of all texts as (doc, token) arrays, in reading order.
+
+    The regexes run once over the whole corpus joined with separator characters,
+    which is far faster than per-response string ops. Clause punctuation is
+    kept as a "." token so modifiers do not reach across it.
+    """
+    corpus = _SEPARATOR.join(str(t).replace(_SEPARATOR, " ") for t in texts).lower()
+    corpus = _OTHER.sub(" ", _CLAUSE.sub(" . ", _CONTRACTION.sub("nt", corpus)))
+    tokens = np.array(corpus.replace(_SEPARATOR, f" {_SEPARATOR} ").split(), dtype=object)
+    is_separator = tokens == _SEPARATOR
+    doc = np.cumsum(is_separator)[~is_separator]
+    return doc.astype(np.int64), tokens[~is_separator]
+
+
+def modifier_matrix(texts, lexicon=None):
+    """Sparse (docs x vocabulary) matrix of modifier-weighted sentiment-word counts.
+
+    Each occurrence of a lexicon word contributes a multiplier that folds in
+    preceding boosters/dampeners, negation within three words, and the "but"
+    rule (clauses before "but" count half, after it one and a half). Scores are
+    then modifier_matrix @ valence. Returns (matrix, valence, vocabulary).
+    """
+    lexicon = LEXICON if lexicon is None else lexicon
+    doc, tokens = _tokenize(texts)
+    codes, vocab = pd.factorize(tokens)
+    valence = np.array([lexicon.get(t, 0.0) for t in vocab], dtype=np.float64)
+    is_negation = np.array([t in NEGATIONS for t in vocab])
+    boost = np.array([BOOSTERS.get(t, 0.0) for t in vocab])
+    is_but = vocab == "but"
+    is_boundary = vocab == _BOUNDARY
+
+    v = valence[codes]
+    magnitude = np.abs(v)
+    multiplier = np.ones(len(codes))
+    negated = np.zeros(len(codes), dtype=bool)
+    blocked = np.zeros(len(codes), dtype=bool)
+    for distance, decay in enumerate(_WINDOW_DECAY, start=1):
+        if len(codes) <= distance:
+            break
+        prev = np.r_[np.zeros(distance, dtype=codes.dtype), codes[:-distance]]
+        same_doc = np.r_[np.zeros(distance, dtype=bool), doc[distance:] == doc[:-distance]]
+        blocked |= ~same_doc | is_boundary[prev]
+        valid = ~blocked
+        step = np.where(valid, boost[prev] * decay, 0.0)
+        multiplier += np.divide(step, magnitude, out=np.zeros_like(step), where=magnitude > 0)
+        negated |= valid & is_negation[prev]
+    multiplier = np.where(negated, multiplier * NEGATION_SCALAR, multiplier)
+
+    buts = is_but[codes].astype(np.int64)
+    n_docs = len(texts)
+    if buts.any():
+        doc_start = np.searchsorted(doc, doc)
+        running = np.cumsum(buts)
+        seen_but = running - running[doc_start] + buts[doc_start] > 0
+        has_but = np.bincount(doc, weights=buts, minlength=n_docs) > 0
+        multiplier *= np.where(has_but[doc], np.where(seen_but, 1.5, 0.5), 1.0)
+
+    hit = v != 0
+    matrix = sparse.csr_matrix(
+        (multiplier[hit], (doc[hit], codes[hit])), shape=(n_docs, len(vocab))
+    )
+    return matrix, valence, np.asarray(vocab)
+
+
+def score_texts(texts, lexicon=None, alpha=15.0):
+    """Per-response sentiment: compound score in [-1, 1] and a label.
+
+    The raw sum of modifier-weighted valences is squashed with
+    x / sqrt(x^2 + alpha); scores of at least +/-0.05 are positive / negative.
+    """
+    matrix, valence, _ = modifier_matrix(texts, lexicon)
+    raw = matrix @ valence
+    compound = raw / np.sqrt(raw * raw + alpha)
+    labels = np.where(compound >= 0.05, "positive", np.where(compound <= -0.05, "negative", "neutral"))
+    return pd.DataFrame({"sentiment": compound.round(4), "label": labels})
+
+
+def cached_sentiment(texts, lexicon=None):
+    """score_texts for a corpus, kept on disk keyed by its content and the lexicon"""
+    lexicon_key = "" if lexicon is None else sorted(lexicon.items())
+    key = cache.content_key("\n".join(texts), lexicon_key, SENTIMENT_VERSION)
+    path = cache.entry_path(_CACHE_NAMESPACE, key) + ".npy"
+    if os.path.exists(path):
+        cache.touch(path)
+        compound = np.load(path)
+        labels = np.where(compound >= 0.05, "positive", np.where(compound <= -0.05, "negative", "neutral"))
+        return pd.DataFrame({"sentiment": compound, "label": labels})
+    scores = score_texts(texts, lexicon)
+    tmp = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp, scores["sentiment"].to_numpy())
+    os.replace(tmp, path)
+    cache.evict_lru(_CACHE_NAMESPACE)
+    return scores
+
+
+def sentiment_summary(scores, groups, weights=None):
+    """Sentiment aggregates per group: responses, mean score and label shares.
+
+    groups labels each scored row (a topic, a segment value, ...); weights are
+    row multiplicities or soft topic memberships.
+    """
+    frame = pd.DataFrame({
+        "group": np.asarray(groups),
+        "weight": 1.0 if weights is None else np.asarray(weights, dtype=float),
+        "sentiment": scores["sentiment"].to_numpy(),
+        "label": scores["label"].to_numpy(),
+    })
+    frame["weighted"] = frame["sentiment"] * frame["weight"]
+    for label in ("positive", "neutral", "negative"):
+        frame[label] = (frame["label"] == label) * frame["weight"]
+    summary = frame.groupby("group")[["weight", "weighted", "positive", "neutral", "negative"]].sum()
+    total = summary["weight"].where(summary["weight"] > 0)
+    return pd.DataFrame({
+        "responses": summary["weight"].round(1),
+        "mean_sentiment": (summary["weighted"] / total).round(3),
+        "% positive": (100 * summary["positive"] / total).round(1),
+        "% neutral": (100 * summary["neutral"] / total).round(1),
+        "% negative": (100 * summary["negative"] / total).round(1),
+    })
@@ -1,5 +1,7 @@
+import numpy as np
 import pandas as pd
 from scipy import stats
+from utils.profiling import describe_profile, profile_dataset
 
 def run_group_comparison(df, group1, group2):
     """Compare two groups statistically"""
@@ -30,5 +32,144 @@ def run_z_chi_tests(df):
     return pd.DataFrame(results)
 
 def get_descriptive_stats(df):
-    """Get enhanced descriptive statistics"""
-    return df.describe(include='all')
+    """Get enhanced descriptive statistics (from the cached dataset profile)"""
+    return describe_profile(profile_dataset(df))
+
+
+def fdr_bh(p_values):
+    """Benjamini-Hochberg adjusted p-values (q-values); NaNs are left out and stay NaN"""
+    p = np.asarray(p_values, dtype=np.float64)
+    q = np.full(p.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(p))
+    if len(valid):
+        order = valid[np.argsort(p[valid])]
+        ranked = p[order] * len(valid) / np.arange(1, len(valid) + 1)
+        q[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1.0)
+    return q
+
+
+def _welch_tests(X, starts, pair_a, pair_b):
+    """Welch t-tests for every group pair x metric from per-group moments.
+
+    Rows of X are ordered by group, with each group starting at starts.
+    Returns (counts, means) as groups x metrics and t, df, p as pairs x metrics.
+    """
+    present = ~np.isnan(X)
+    counts = np.add.reduceat(present, starts, axis=0, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.add.reduceat(np.where(present, X, 0.0), starts, axis=0) / counts
+        deviations = np.where(present, X - np.repeat(means, np.diff(np.r_[starts, len(X)]), axis=0), 0.0)
+        variances = np.add.reduceat(deviations * deviations, starts, axis=0) / (counts - 1)
+        sa, sb = variances[pair_a] / counts[pair_a], variances[pair_b] / counts[pair_b]
+        t = (means[pair_a] - means[pair_b]) / np.sqrt(sa + sb)
+        df = (sa + sb) ** 2 / (sa * sa / (counts[pair_a] - 1) + sb * sb / (counts[pair_b] - 1))
+    p = 2 * stats.t.sf(np.abs(t), df)
+    return counts, means, t, df, p
+
+
+def _mann_whitney_u(X, codes, n_groups, max_cells=20_000_000):
+    """Mann-Whitney U of group i against group j for every metric, plus tie sums.
+
+    Each metric is sorted once and its values replaced by dense ranks, giving
+    a histogram of counts per (metric, group, distinct value). The number of
+    values of group j below each value of group i (ties count half) then
+    makes U for all pairs one batched matmul; survey metrics have few
+    distinct values, so the histograms are small. Returns U and ties as
+    metrics x groups x groups, where ties[i, j] is the sum of t^3 - t over
+    tie blocks of groups i and j combined.
+    """
+    n, n_metrics = X.shape
+    # One contiguous row per metric, so the sort runs along memory
+    rows = np.ascontiguousarray(X.T)
+    # Ties get one dense rank whatever their order, so the sort need not be stable
+    order = np.argsort(rows, axis=1)
+    values = np.sort(rows, axis=1)
+    groups = codes[order]
+    present = ~np.isnan(values)
+    # Dense rank of each sorted value; missing values sort last and are dropped below
+    changed = np.c_[np.ones((n_metrics, 1), bool), values[:, 1:] != values[:, :-1]]
+    ranks = np.cumsum(changed, axis=1) - 1
+    n_levels = (changed & present).sum(axis=1)
+
+    U = np.empty((n_metrics, n_groups, n_groups))
+    ties = np.empty((n_metrics, n_groups, n_groups))
+    # Chunks of metrics with similar level counts keep the histograms dense and bounded
+    by_levels = np.argsort(n_levels, kind="stable")
+    start = 0
+    while start < n_metrics:
+        width = max(1, max_cells // (n_groups * max(int(n_levels[by_levels[start]]), 1)))
+        chunk = by_levels[start:start + width]
+        while len(chunk) > 1 and len(chunk) * n_groups * n_levels[chunk[-1]] > max_cells:
+            chunk = chunk[:len(chunk) // 2]
+        start += len(chunk)
+        levels = max(int(n_levels[chunk].max()), 1)
+        keep = present[chunk]
+        cell = (np.arange(len(chunk))[:, None] * n_groups + groups[chunk]) * levels + ranks[chunk]
+        hist = np.bincount(cell[keep], minlength=len(chunk) * n_groups * levels)
+        hist = hist.reshape(len(chunk), n_groups, levels).astype(np.float64)
+        below = np.cumsum(hist, axis=2) - hist
+        U[chunk] = np.matmul(hist, (below + hist / 2).transpose(0, 2, 1))
+        cubes = (hist ** 3).sum(axis=2)
+        cross = np.matmul(hist ** 2, hist.transpose(0, 2, 1))
+        sizes = hist.sum(axis=2)
+        ties[chunk] = (
+            cubes[:, :, None] + cubes[:, None, :] + 3 * cross + 3 * cross.transpose(0, 2, 1)
+            - sizes[:, :, None] - sizes[:, None, :]
+        )
+    return U, ties
+
+
+def run_pairwise_group_tests(df, group_col, metrics=None, alpha=0.05, mann_whitney=True):
+    """Welch t-test and Mann-Whitney U test of every metric between every pair of groups.
+
+    All pairs x metrics are computed as batched array operations, and p-values
+    are Benjamini-Hochberg (FDR) corrected across all tests of each kind.
+    Mann-Whitney uses the normal approximation with tie and continuity
+    correction (as scipy's asymptotic method). Returns a tidy DataFrame with
+    one row per metric and group pair; significant marks q_welch < alpha and
+    significant_mannwhitney marks q_mannwhitney < alpha.
+    """
+    if metrics is None:
+        metrics = [c for c in df.select_dtypes(include=["number", "bool"]).columns if c != group_col]
+    data = df[df[group_col].notna()]
+    codes, levels = pd.factorize(data[group_col], sort=True)
+    # Rows ordered by group, so per-group sums are contiguous reductions
+    by_group = np.argsort(codes, kind="stable")
+    codes = codes[by_group]
+    X = data[metrics].to_numpy(dtype=np.float64, na_value=np.nan)[by_group]
+    n_groups = len(levels)
+    starts = np.searchsorted(codes, np.arange(n_groups))
+    pair_a, pair_b = np.triu_indices(n_groups, k=1)
+
+    counts, means, t, df_welch, p_welch = _welch_tests(X, starts, pair_a, pair_b)
+    n_a, n_b = counts[pair_a], counts[pair_b]
+    result = {
+        "metric": np.tile(np.asarray(metrics, dtype=object), len(pair_a)),
+        "group_a": np.repeat(np.asarray(levels, dtype=object)[pair_a], len(metrics)),
+        "group_b": np.repeat(np.asarray(levels, dtype=object)[pair_b], len(metrics)),
+        "n_a": n_a.ravel().astype(np.int64),
+        "n_b": n_b.ravel().astype(np.int64),
+        "mean_a": means[pair_a].ravel(),
+        "mean_b": means[pair_b].ravel(),
+        "mean_diff": (means[pair_a] - means[pair_b]).ravel(),
+        "t": t.ravel(),
+        "df": df_welch.ravel(),
+        "p_welch": p_welch.ravel(),
+    }
+    result["q_welch"] = fdr_bh(result["p_welch"])
+    if mann_whitney:
+        U, ties = _mann_whitney_u(X, codes, n_groups)
+        u = U[:, pair_a, pair_b].T
+        total = n_a + n_b
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sigma = np.sqrt(n_a * n_b / 12 * ((total + 1) - ties[:, pair_a, pair_b].T / (total * (total - 1))))
+            z = (np.maximum(u, n_a * n_b - u) - n_a * n_b / 2 - 0.5) / np.where(sigma > 0, sigma, np.nan)
+            result["U"] = u.ravel()
+            result["rank_biserial"] = (2 * u / (n_a * n_b) - 1).ravel()
+        result["p_mannwhitney"] = np.clip(2 * stats.norm.sf(z), 0, 1).ravel()
+        result["q_mannwhitney"] = fdr_bh(result["p_mannwhitney"])
+    out = pd.DataFrame(result)
+    out["significant"] = out["q_welch"] < alpha
+    if mann_whitney:
+        out["significant_mannwhitney"] = out["q_mannwhitney"] < alpha
+    return out
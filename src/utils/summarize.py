@@ -0,0 +1,102 @@
+import zlib
+from utils.gpt_helpers import chat_batch
+
+REDUCE_PROMPT = (
+    "You are combining partial analyses of the same survey's open-ended responses. "
+    "Merge them into one analysis that follows the original instructions below, keeping "
+    "themes that recur across parts, noting how prevalent each is, and dropping duplicates.\n\n"
+    "Original instructions: {instructions}"
+)
+
+WEIGHT_NOTE = (
+    "\n\nA response prefixed with [N×] stands for N near-identical responses; "
+    "weigh it accordingly when judging how common a theme is."
+)
+
+
+def _tokens(text):
+    return len(text) // 4 + 1
+
+
+def pack_chunks(texts, chunk_tokens=3000, boundary_every=40):
+    """Pack texts into chunks of at most ~chunk_tokens tokens.
+
+    Besides the budget, a chunk also ends after any text whose hash hits a
+    1-in-boundary_every pattern. Such content-defined boundaries stay put when
+    other responses change, so unchanged chunks keep identical prompts and are
+    served from the LLM cache on re-runs.
+    """
+    chunks, current, used = [], [], 0
+    for text in texts:
+        text = text[:chunk_tokens * 4]
+        cost = _tokens(text)
+        if current and used + cost > chunk_tokens:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += cost
+        if zlib.crc32(text.encode("utf-8")) % boundary_every == 0:
+            chunks.append(current)
+            current, used = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _run_level(prompts, system, model, module, on_progress, stage, **batch_kwargs):
+    messages = [[{"role": "system", "content": system}, {"role": "user", "content": p}] for p in prompts]
+    done = []
+
+    def on_result(index, result):
+        done.append(index)
+        if on_progress:
+            on_progress(stage, len(done), len(prompts))
+
+    results = chat_batch(messages, model=model, module=module, on_result=on_result, **batch_kwargs)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise errors[0]
+    return [r.strip() for r in results]
+
+
+def map_reduce_summarize(texts, instructions, model="gpt-3.5-turbo", chunk_tokens=3000, fan_in=8,
+                         module="default", on_progress=None, weights=None, **batch_kwargs):
+    """Summarize every text with a concurrent map step and a tree of reduce steps.
+
+    Texts are packed into token-budgeted chunks and each chunk is summarized
+    with `instructions` as the system prompt. Partial summaries are then merged
+    fan_in at a time, level by level, until one synthesis remains. Every call
+    goes through the LLM cache, so re-runs only pay for chunks that changed.
+    on_progress(stage, done, total) reports each finished request.
+    weights are multiplicities of collapsed near-duplicates (see
+    dedup.dedupe_texts); they are shown to the model as [N×] prefixes.
+    """
+    if weights is not None:
+        texts = [t if w == 1 else f"[{int(w)}×] {t}" for t, w in zip(texts, weights) if t and t.strip()]
+    texts = [t for t in texts if t and t.strip()]
+    if not texts:
+        return ""
+    chunks = pack_chunks(texts, chunk_tokens)
+    map_system = instructions + WEIGHT_NOTE if weights is not None else instructions
+    partials = _run_level(
+        ["\n".join(chunk) for chunk in chunks], map_system, model, module, on_progress, "map", **batch_kwargs
+    )
+    reduce_system = REDUCE_PROMPT.format(instructions=instructions)
+    level = 1
+    while len(partials) > 1:
+        groups, current, used = [], [], 0
+        for part in partials:
+            cost = _tokens(part)
+            if current and (len(current) >= fan_in or used + cost > chunk_tokens):
+                groups.append(current)
+                current, used = [], 0
+            current.append(part)
+            used += cost
+        groups.append(current)
+        if len(groups) == len(partials):
+            # Parts too large to pair within the budget: merge pairwise anyway
+            groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+        prompts = ["\n\n---\n\n".join(f"Part {i + 1}:\n{p}" for i, p in enumerate(g)) for g in groups]
+        partials = _run_level(prompts, reduce_system, model, module, on_progress, f"reduce {level}", **batch_kwargs)
+        level += 1
+    return partials[0]